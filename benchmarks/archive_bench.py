@@ -0,0 +1,87 @@
+"""
+Бенчмарк форматов архивов: скорость архивации и степень сжатия для разных уровней сжатия
+на синтетическом дереве из текстовых файлов и уже сжатых (случайных) файлов, а также ускорение zip и gztar с -j
+
+Запуск: python -m benchmarks.archive_bench
+"""
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.grep_bench import create_synthetic_tree
+from src.commands.plugins.archive import ARCHIVE_FORMATS, write_archive
+
+
+DIRS = 10
+FILES_PER_DIR = 100
+
+RANDOM_FILES = 10
+RANDOM_FILE_SIZE = 1024 ** 2
+
+
+def tree_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files)
+
+
+def run(
+    source_path: str, dest_dir: str, format: str, level: int | None, store: bool = False, jobs: int = 1
+) -> tuple[float, int]:
+    dest_path = os.path.join(dest_dir, f"{format}_{level}_{store}_{jobs}.{ARCHIVE_FORMATS[format].extension}")
+
+    start = time.perf_counter()
+    write_archive(dest_path, format, source_path, ignore=False, level=level, store=store, jobs=jobs)
+    elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(dest_path)
+    os.remove(dest_path)
+    return elapsed, size
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as source_path, tempfile.TemporaryDirectory() as dest_dir:
+        create_synthetic_tree(source_path, DIRS, FILES_PER_DIR)
+
+        rng = random.Random(0)
+        random_dir = os.path.join(source_path, "compressed")
+        os.makedirs(random_dir)
+        for i in range(RANDOM_FILES):
+            with open(os.path.join(random_dir, f"file{i}.bin"), 'wb') as f:
+                f.write(rng.randbytes(RANDOM_FILE_SIZE))
+
+        total = tree_size(source_path)
+        run(source_path, dest_dir, 'tar', None)  # warm up page cache
+
+        print(f"{DIRS * FILES_PER_DIR} text files and {RANDOM_FILES} random files, {total / 1024 ** 2:.1f} MiB")
+        print(f"{'format':<8} {'level':>7} {'time':>9} {'MiB/s':>8} {'ratio':>7}")
+
+        cases: list[tuple[str, int | None, bool]] = [('zip', None, True)]
+        for format, archive_format in ARCHIVE_FORMATS.items():
+            levels = archive_format.levels
+            if levels is None:
+                cases.append((format, None, False))
+            else:  # the fastest, the default and the best levels
+                cases += [(format, level, False) for level in (levels[0], None, levels[-1])]
+
+        for format, level, store in cases:
+            elapsed, size = run(source_path, dest_dir, format, level, store)
+            level_name = "store" if store else ("default" if level is None else str(level))
+            print(f"{format:<8} {level_name:>7} {elapsed:8.3f}s {total / 1024 ** 2 / elapsed:8.1f} {total / size:7.2f}")
+
+        cpu_count = os.cpu_count() or 1
+        jobs_list = sorted({1, *[2 ** i for i in range(cpu_count.bit_length()) if 2 ** i <= cpu_count], cpu_count})
+
+        print(f"\nparallel compression, {cpu_count} CPUs")
+        for format in (format for format, archive_format in ARCHIVE_FORMATS.items() if archive_format.parallel):
+            baseline = None
+            for jobs in jobs_list:
+                elapsed, size = run(source_path, dest_dir, format, None, jobs=jobs)
+                baseline = baseline or elapsed
+                print(
+                    f"{format:<8} -j {jobs:<3} {elapsed:8.3f}s {total / 1024 ** 2 / elapsed:8.1f} MiB/s"
+                    f" {total / size:7.2f}  x{baseline / elapsed:.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
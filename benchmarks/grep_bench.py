@@ -0,0 +1,59 @@
+"""
+Бенчмарк параллельного grep -r на синтетическом дереве файлов
+
+Запуск: python -m benchmarks.grep_bench
+"""
+import os
+import random
+import string
+import tempfile
+import time
+
+from src.commands.plugins.grep import SearchPlan, search_files, walk_files
+
+
+DIRS = 50
+FILES_PER_DIR = 200
+LINES_PER_FILE = 100
+
+
+def create_synthetic_tree(path: str, dirs: int = DIRS, files_per_dir: int = FILES_PER_DIR) -> None:
+    rng = random.Random(0)
+    for i in range(dirs):
+        dir_path = os.path.join(path, f"dir{i}")
+        os.makedirs(dir_path)
+        for j in range(files_per_dir):
+            lines = (
+                " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(10))
+                for _ in range(LINES_PER_FILE)
+            )
+            with open(os.path.join(dir_path, f"file{j}.txt"), 'w') as f:
+                f.write("\n".join(lines) + "\n")
+
+
+def run(path: str, pattern: str, jobs: int) -> float:
+    start = time.perf_counter()
+    for _ in search_files(SearchPlan(pattern, False), walk_files(path), jobs):
+        pass
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    cpu_count = os.cpu_count() or 1
+    jobs_list = sorted({1, *[2 ** i for i in range(cpu_count.bit_length()) if 2 ** i <= cpu_count], cpu_count})
+    files_count = DIRS * FILES_PER_DIR
+
+    with tempfile.TemporaryDirectory() as path:
+        create_synthetic_tree(path)
+        run(path, "goose", 1)  # warm up page cache
+
+        baseline = None
+        print(f"{files_count} files, {cpu_count} CPUs")
+        for jobs in jobs_list:
+            elapsed = run(path, r"go+se|[xyz]{4}", jobs)
+            baseline = baseline or elapsed
+            print(f"-j {jobs:<3} {elapsed:8.3f}s {files_count / elapsed:10.0f} files/s  x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Бенчмарк grep -r с индексом триграмм и без него на синтетическом дереве файлов
+
+Запуск: python -m benchmarks.grep_index_bench
+"""
+import os
+import tempfile
+import time
+
+from collections.abc import Callable
+
+from benchmarks.grep_bench import create_synthetic_tree
+from src.commands.plugins.grep import SearchPlan, search_files, walk_files, index_candidates
+from src.trigram_index import TrigramIndex, get_index_path
+
+
+DIRS = 20
+FILES_PER_DIR = 100
+
+PATTERN = r"needle_\d+"
+NEEDLES = 20
+
+
+def measure(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    plan = SearchPlan(PATTERN, False)
+
+    with tempfile.TemporaryDirectory() as path:
+        create_synthetic_tree(path, DIRS, FILES_PER_DIR)
+        for i in range(NEEDLES):
+            with open(os.path.join(path, f"dir{i}", "file0.txt"), 'a') as f:
+                f.write(f"needle_{i}\n")
+
+        def cold() -> None:
+            list(search_files(plan, walk_files(path), 1))
+
+        def indexed() -> None:
+            list(search_files(plan, index_candidates(path, walk_files(path), plan), 1))
+
+        def build() -> None:
+            with TrigramIndex(path) as index:
+                index.update(walk_files(path))
+
+        cold()  # warm up page cache
+
+        print(f"{DIRS * FILES_PER_DIR} files, pattern {PATTERN!r} in {NEEDLES} files")
+        print(f"cold search                      {measure(cold):8.3f}s")
+        print(f"index build                      {measure(build):8.3f}s")
+        print(f"indexed search                   {measure(indexed):8.3f}s")
+
+        for i in range(0, DIRS, 2):  # touch a few files to measure incremental reindexing
+            with open(os.path.join(path, f"dir{i}", "file1.txt"), 'a') as f:
+                f.write("changed\n")
+        print(f"indexed search, {DIRS // 2} files changed  {measure(indexed):8.3f}s")
+
+        os.remove(get_index_path(path))
+
+
+if __name__ == "__main__":
+    main()
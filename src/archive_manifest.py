@@ -0,0 +1,111 @@
+import os
+import stat
+import hashlib
+
+from collections.abc import Iterable
+from typing import NamedTuple
+
+from src.constants import ARCHIVE_MANIFEST_SUFFIX
+
+
+#  ManifestEntry.kind
+DIRECTORY = 'd'
+FILE = 'f'
+SYMLINK = 'l'
+
+
+class ManifestEntry(NamedTuple):
+    kind: str
+    size: int
+    mtime_ns: int
+    digest: str  # sha256 of the contents or of the symlink target, empty for directories
+
+
+class Changes(NamedTuple):
+    manifest: dict[str, ManifestEntry]  # state of the directory after the archive
+    members: list[tuple[str, str]]  # new and changed files and directories
+    deleted: list[str]  # names which are gone or changed their kind since the previous archive
+
+
+def get_manifest_path(archive_path: str) -> str:
+    return archive_path + ARCHIVE_MANIFEST_SUFFIX
+
+
+def get_temp_manifest_path(manifest_path: str) -> str:
+    return manifest_path + '.tmp'
+
+
+def read_manifest(path: str) -> dict[str, ManifestEntry]:
+    """
+    Читает манифест архива. Каждая строка - тип, размер, время изменения, хэш и имя в архиве, разделенные табуляцией
+    :param path: Путь к манифесту
+    :return: Возвращает записи манифеста по именам в архиве
+    """
+    manifest = {}
+    with open(path, 'r') as f:
+        for line in f.read().splitlines():
+            kind, size, mtime_ns, digest, name = line.split('\t', 4)  # the name goes last, it can contain tabs
+            manifest[name] = ManifestEntry(kind, int(size), int(mtime_ns), digest)
+    return manifest
+
+
+def write_manifest(path: str, manifest: dict[str, ManifestEntry]) -> None:
+    temp_path = get_temp_manifest_path(path)
+    with open(temp_path, 'w') as f:
+        for name, entry in manifest.items():
+            f.write(f"{entry.kind}\t{entry.size}\t{entry.mtime_ns}\t{entry.digest}\t{name}\n")
+    os.replace(temp_path, path)  # the old manifest stays if archiving is interrupted
+
+
+def get_entry(path: str, old_entry: ManifestEntry | None) -> ManifestEntry | None:
+    """
+    Создает запись манифеста для файла. Файл читается, только если его размер или время изменения не совпадают с манифестом
+    :param path: Путь к файлу
+    :param old_entry: Запись из предыдущего манифеста
+    :return: Возвращает запись или None для файлов, которые не отслеживаются (fifo, устройства)
+    """
+    st = os.lstat(path)
+
+    if stat.S_ISDIR(st.st_mode):
+        return ManifestEntry(DIRECTORY, 0, 0, "")
+    if stat.S_ISLNK(st.st_mode):
+        return ManifestEntry(SYMLINK, 0, 0, hashlib.sha256(os.fsencode(os.readlink(path))).hexdigest())
+    if not stat.S_ISREG(st.st_mode):
+        return None
+
+    if old_entry is not None and old_entry.kind == FILE and (old_entry.size, old_entry.mtime_ns) == (st.st_size, st.st_mtime_ns):
+        return old_entry
+
+    with open(path, 'rb') as f:
+        digest = hashlib.file_digest(f, 'sha256').hexdigest()
+    return ManifestEntry(FILE, st.st_size, st.st_mtime_ns, digest)
+
+
+def find_changes(members: Iterable[tuple[str, str]], old_manifest: dict[str, ManifestEntry]) -> Changes:
+    """
+    Сравнивает директорию с манифестом предыдущего архива. Файлы, у которых изменилось только время изменения,
+    но не содержимое, не считаются измененными
+    :param members: Пути и имена в архиве всех файлов и директорий
+    :param old_manifest: Манифест предыдущего архива
+    :return: Возвращает новый манифест, новые и измененные файлы и удаленные имена
+    """
+    manifest = {}
+    changed = []
+
+    for path, name in members:
+        old_entry = old_manifest.get(name)
+        entry = get_entry(path, old_entry)
+
+        if entry is None:
+            changed.append((path, name))
+            continue
+
+        manifest[name] = entry
+        if old_entry is None or (old_entry.kind, old_entry.digest) != (entry.kind, entry.digest):
+            changed.append((path, name))
+
+    deleted = [
+        name for name, old_entry in old_manifest.items()
+        if name not in manifest or manifest[name].kind != old_entry.kind  # removed before the new kind is extracted
+    ]
+    return Changes(manifest, changed, deleted)
@@ -1,19 +1,69 @@
 from __future__ import annotations
 
 import os
+import sys
+import time
 import logging
 
 import inspect
 
-from collections.abc import Callable
+from collections import deque
+from collections.abc import Callable, Iterable
 from types import ModuleType
 
+from src.constants import OUTPUT_BUFFER_LINES, OUTPUT_FLUSH_INTERVAL, OUTPUT_RING_SIZE
+
+
+CAPTURE_OFF = 'off'
+CAPTURE_RING = 'ring'
+CAPTURE_FULL = 'full'
+CAPTURE_MODES = (CAPTURE_OFF, CAPTURE_RING, CAPTURE_FULL)
+
+
+class OutputCapture:
+    """
+    Сохраняет вывод команды: не сохраняет ('off'), хранит последние символы ('ring') или весь вывод ('full').
+    Части вывода хранятся списком и соединяются только при чтении
+    """
+    def __init__(self, mode: str = CAPTURE_FULL, size: int = OUTPUT_RING_SIZE):
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Invalid capture mode {mode}")
+
+        self.mode = mode
+        self.size = size
+        self.chunks: deque[str] = deque()
+        self.length = 0
+
+    def append(self, text: str) -> None:
+        if self.mode == CAPTURE_OFF or not text:
+            return
+
+        self.chunks.append(text)
+        self.length += len(text)
+
+        if self.mode == CAPTURE_RING:  # drop old chunks that are entirely outside of the last size characters
+            while len(self.chunks) > 1 and self.length - len(self.chunks[0]) >= self.size:
+                self.length -= len(self.chunks.popleft())
+
+    def clear(self) -> None:
+        self.chunks.clear()
+        self.length = 0
+
+    def getvalue(self) -> str:
+        value = "".join(self.chunks)
+        if self.mode == CAPTURE_RING:
+            value = value[-self.size:]
+
+        self.clear()
+        self.append(value)  # keep the joined value, so reading it again does not join again
+        return value
+
 
 class CommandEnv():
-    def __init__(self, log_filename: str, cwd: str):
+    def __init__(self, log_filename: str, cwd: str, capture: str = CAPTURE_FULL):
         self.commands: dict[str, Command] = {}
         self.cwd = cwd
-        self.command_output = ""
+        self.output = OutputCapture(capture)
 
         self.setup_logger(log_filename)
 
@@ -30,9 +80,47 @@ class CommandEnv():
 
         return os.path.normpath(path)
 
+    @property
+    def command_output(self) -> str:
+        return self.output.getvalue()
+
     def print(self, message: str = "") -> None:
         print(message)
-        self.command_output += message + '\n'
+        self.output.append(message + '\n')
+
+    def write(self, text: str) -> None:
+        """
+        Выводит текст без добавления переноса строки, например очередной блок файла
+        :param text: Текст
+        :return: Данная функция ничего не возвращает
+        """
+        sys.stdout.write(text)
+        self.output.append(text)
+
+    def print_lines(self, lines: Iterable[str]) -> int:
+        """
+        Выводит строки по мере их получения. Строки копятся в небольшом буфере, который выводится, когда он заполнен или прошло достаточно времени
+        :param lines: Строки без символа переноса
+        :return: Возвращает количество выведенных строк
+        """
+        buffer: list[str] = []
+        count = 0
+        last_flush = time.monotonic()
+
+        try:
+            for line in lines:
+                buffer.append(line)
+                count += 1
+
+                if len(buffer) >= OUTPUT_BUFFER_LINES or time.monotonic() - last_flush >= OUTPUT_FLUSH_INTERVAL:
+                    self.print("\n".join(buffer))
+                    buffer.clear()
+                    last_flush = time.monotonic()
+        finally:
+            if buffer:
+                self.print("\n".join(buffer))
+
+        return count
 
     def setup_logger(self, log_filename: str) -> None:
         """
@@ -63,7 +151,7 @@ class CommandEnv():
 
     def log_and_raise_exception(self, exception: Exception) -> None:
         message = f"Error: {str(exception)}"
-        self.command_output += message + '\n'
+        self.output.append(message + '\n')
         self.logger.error(message)
         raise exception
 
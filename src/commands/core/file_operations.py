@@ -1,13 +1,17 @@
 import os
+import errno
 import shutil
 import shlex
 
 from argparse import ArgumentParser
 from src.command import command, CommandEnv
 from src.path import validate_path
+from src.fastcopy import copy2, CopyPool, CopyFunction
 
-from src.constants import TRASH_DIR
-from src.constants import UNDO_HISTORY_PATH
+from src.trash import ensure_trash_dir, get_operation_trash_path, empty_trash, enforce_trash_policy, TRASH_WORKER, TRASH_LOCK
+from src.trash import TrashPolicy, read_trash_policy, write_trash_policy
+from src.undo_journal import UndoJournal, Operation
+from src.constants import COPY_DEFAULT_JOBS
 
 
 def safety_check_root(source: str) -> None:
@@ -25,34 +29,37 @@ def safety_check_source_in_dest(source: str, dest: str) -> None:
         raise PermissionError("Unable to operate with parent directory")
 
 
-def get_next_undo_count() -> int:
-    if not os.path.exists(UNDO_HISTORY_PATH):
-        return 1
-
-    with open(UNDO_HISTORY_PATH, 'r') as f:
-        lines = f.readlines()
-
-    return len(lines) + 1
-
-
-def get_undo_prefix() -> str:
-    return f"{get_next_undo_count()}_"
-
-
-def add_undo_command(name: str, args: list[str]) -> None:
-    args.insert(0, name)
-
-    with open(UNDO_HISTORY_PATH, 'a') as f:
-        f.write(f"{shlex.join(args)}\n")
-
-
-def copy_and_trash_overwritten_function(undo_prefix: str, dest_path: str, undo_paths: list[str], add_all_paths: bool):
+def trash_overwritten(path: str, trash_path: str) -> None:
+    """
+    Переносит файл, который будет перезаписан, в .trash. Если .trash на другой файловой системе, файл копируется
+    :param path: Путь к файлу
+    :param trash_path: Путь к файлу в .trash
+    :return: Данная функция ничего не возвращает
     """
-    Создает функцию копирования, которая копирует файлы в .trash перед тем, как их перезаписать
+    try:
+        os.rename(path, trash_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copy2(path, trash_path)  # the original is overwritten right after
+
+
+def copy_and_trash_overwritten_function(
+    trash_dir: str,
+    undo_prefix: str,
+    dest_path: str,
+    undo_paths: list[str],
+    add_all_paths: bool,
+    copy_function: CopyFunction = copy2,
+):
+    """
+    Создает функцию копирования, которая переносит файлы в корзину перед тем, как их перезаписать
+    :param trash_dir: Директория корзины на файловой системе конечного пути
     :param undo_prefix: Преписка к названию файла или директории в .trash, где пишется номер операции, который нужен для undo. Это нужно для того, чтобы имя файла было уникальным, чтобы он не перезаписался
     :param dest_path: Конечный путь копирования
     :param undo_paths: Список путей, нужных для восстановления для команды undo
     :param add_all_paths: Добавлять каждый файл в undo_paths или только те, которые перезаписали
+    :param copy_function: Функция, которая копирует сам файл, например CopyPool.copy. Перезаписываемый файл переносится в .trash сразу, до вызова copy_function
     :return: Функцию копированию, аналогичной shutil.copy()
     """
     def _copy_and_trash_overwritten(src: str, dst: str, *, follow_symlinks=True):
@@ -61,19 +68,104 @@ def copy_and_trash_overwritten_function(undo_prefix: str, dest_path: str, undo_p
         if dst_exists:
             rel_ovewritten_trash_path = os.path.relpath(dst, dest_path)
             ovewritten_trash_dir = undo_prefix + os.path.basename(dest_path)
-            ovewritten_trash_path = os.path.join(TRASH_DIR, ovewritten_trash_dir, rel_ovewritten_trash_path)
+            ovewritten_trash_path = os.path.join(trash_dir, ovewritten_trash_dir, rel_ovewritten_trash_path)
 
             os.makedirs(os.path.dirname(ovewritten_trash_path), exist_ok=True)
-            shutil.copy2(dst, ovewritten_trash_path)
+            trash_overwritten(dst, ovewritten_trash_path)
 
         if not dst_exists or add_all_paths:
             undo_paths.append(dst)
 
-        shutil.copy2(src, dst, follow_symlinks=follow_symlinks)
+        copy_function(src, dst, follow_symlinks=follow_symlinks)
 
     return _copy_and_trash_overwritten
 
 
+def check_merge_conflicts(source: str, dest: str) -> None:
+    """
+    Проверяет, что директорию можно слить с существующей, до того как что-либо перенесено:
+    директория не может заменить файл, а файл - директорию, как в GNU mv
+    :param source: Путь к исходной директории
+    :param dest: Путь к существующей конечной директории
+    :return: Данная функция ничего не возвращает
+    """
+    stack = [(source, dest)]
+
+    while stack:
+        source_dir, dest_dir = stack.pop()
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                dst = os.path.join(dest_dir, entry.name)
+                if not os.path.lexists(dst):
+                    continue
+
+                source_is_dir = entry.is_dir(follow_symlinks=False)
+                dest_is_dir = os.path.isdir(dst) and not os.path.islink(dst)
+                if source_is_dir and dest_is_dir:
+                    stack.append((entry.path, dst))
+                elif source_is_dir:
+                    raise FileExistsError(f"Destination is a file {dst}")
+                elif dest_is_dir:
+                    raise FileExistsError(f"Destination is a directory {dst}")
+
+
+def merge_by_rename(source: str, dest: str, trash_dir: str, undo_prefix: str, undo_paths: list[str]) -> None:
+    """
+    Переносит содержимое директории в существующую директорию на той же файловой системе.
+    Поддиректории, которых нет в конечной директории, переносятся целиком одним os.rename, внутрь совпадающих
+    директорий алгоритм спускается, а совпадающие файлы перед переносом переносятся в корзину
+    :param source: Путь к исходной директории. После переноса она удаляется
+    :param dest: Путь к существующей конечной директории
+    :param trash_dir: Директория корзины на файловой системе конечного пути
+    :param undo_prefix: Приписка к названию директории в корзине с номером операции
+    :param undo_paths: Список, в который добавляются перенесенные пути, то есть только то, что нужно вернуть при undo
+    :return: Данная функция ничего не возвращает
+    """
+    check_merge_conflicts(source, dest)  # nothing is moved if the merge would stop half way
+
+    merged_dirs: list[str] = []
+    stack = [(source, dest)]
+
+    while stack:
+        source_dir, dest_dir = stack.pop()
+        merged_dirs.append(source_dir)
+
+        with os.scandir(source_dir) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+
+        conflicting_dirs: list[tuple[str, str]] = []
+        for entry in entries:
+            dst = os.path.join(dest_dir, entry.name)
+            if os.path.lexists(dst):
+                source_is_dir = entry.is_dir(follow_symlinks=False)
+                if source_is_dir and os.path.isdir(dst) and not os.path.islink(dst):
+                    conflicting_dirs.append((entry.path, dst))
+                    continue
+                if source_is_dir:
+                    raise FileExistsError(f"Destination is a file {dst}")
+                if os.path.isdir(dst) and not os.path.islink(dst):
+                    raise FileExistsError(f"Destination is a directory {dst}")
+
+                overwritten_trash_path = os.path.join(
+                    trash_dir, undo_prefix + os.path.basename(dest), os.path.relpath(dst, dest)
+                )
+                os.makedirs(os.path.dirname(overwritten_trash_path), exist_ok=True)
+                trash_overwritten(dst, overwritten_trash_path)
+
+            try:
+                os.rename(entry.path, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:  # a mount point inside the source
+                    raise
+                shutil.move(entry.path, dst, copy_function=copy2)
+            undo_paths.append(dst)
+
+        stack += reversed(conflicting_dirs)  # the stack pops them back in sorted order
+
+    for merged_dir in reversed(merged_dirs):  # everything was moved out of them
+        os.rmdir(merged_dir)
+
+
 def remove_directory_if_empty(path: str) -> None:
     if not os.listdir(path):
         os.rmdir(path)
@@ -87,11 +179,11 @@ def move_and_overwrite(source: str, dest: str) -> None:
     :return: Данная функция ничего не возвращает
     """
     if os.path.isfile(source):
-        shutil.copy2(source, dest)
+        copy2(source, dest)
         os.remove(source)
 
     elif os.path.isdir(source):
-        shutil.copytree(source, dest, dirs_exist_ok=True)
+        shutil.copytree(source, dest, dirs_exist_ok=True, copy_function=copy2)
         shutil.rmtree(source)
 
 
@@ -103,6 +195,7 @@ def move_and_overwrite(source: str, dest: str) -> None:
         dest - destination to copy file/directory to
 
         -r - recursively copy the contents of the directory
+        -j N - number of files copied at the same time
     """
 )
 def cmd_cp(env: CommandEnv, args: list[str]) -> None:
@@ -110,8 +203,12 @@ def cmd_cp(env: CommandEnv, args: list[str]) -> None:
     parser.add_argument('source')
     parser.add_argument('dest')
     parser.add_argument('-r', action='store_true')
+    parser.add_argument('-j', type=int, default=COPY_DEFAULT_JOBS)
     argv = parser.parse_args(args)
 
+    if argv.j < 1:
+        raise ValueError("Number of jobs must be a natural number")
+
     source_path = env.get_path(argv.source)
     validate_path(source_path)
     safety_check_root(source_path)
@@ -122,43 +219,51 @@ def cmd_cp(env: CommandEnv, args: list[str]) -> None:
 
     safety_check_source_in_dest(source_path, dest_path)
 
-    if not os.path.exists(TRASH_DIR):
-        os.makedirs(TRASH_DIR, exist_ok=True)
+    trash_dir = ensure_trash_dir(dest_path)
 
-    undo_prefix = get_undo_prefix()
-    undo_paths: list[str] = [dest_path]
+    with TRASH_LOCK, UndoJournal() as journal:
+        operation_id = journal.begin('cp')
 
-    copy_and_trash_overwritten = copy_and_trash_overwritten_function(
-        undo_prefix=undo_prefix,
-        dest_path=dest_path,
-        undo_paths=undo_paths,
-        add_all_paths=False  # we don't need to remove files that are going to be overwritten anyway during undo
-    )
+        undo_prefix = f"{operation_id}_"
+        undo_paths: list[str] = []
 
-    if os.path.isfile(source_path):
-        try:
-            if os.path.isfile(dest_path):
-                ovewritten_trash_name = undo_prefix + os.path.basename(dest_path)
-                ovewritten_trash_path = os.path.join(TRASH_DIR, ovewritten_trash_name)
+        pool = CopyPool(argv.j)
+        copy_and_trash_overwritten = copy_and_trash_overwritten_function(
+            trash_dir=trash_dir,
+            undo_prefix=undo_prefix,
+            dest_path=dest_path,
+            undo_paths=undo_paths,
+            add_all_paths=False,  # we don't need to remove files that are going to be overwritten anyway during undo
+            copy_function=pool.copy,
+        )
 
-                shutil.copy2(dest_path, ovewritten_trash_path)
+        if os.path.isfile(source_path):
+            try:
+                if os.path.isfile(dest_path):
+                    ovewritten_trash_name = undo_prefix + os.path.basename(dest_path)
+                    ovewritten_trash_path = os.path.join(trash_dir, ovewritten_trash_name)
 
-            shutil.copy2(source_path, dest_path)
-        except PermissionError:
-            raise PermissionError("No permission")
+                    trash_overwritten(dest_path, ovewritten_trash_path)
 
-    if os.path.isdir(source_path):
-        if not argv.r:
-            raise IsADirectoryError("Unable to copy directory without '-r' flag present")
+                copy2(source_path, dest_path)
+            except PermissionError:
+                raise PermissionError("No permission")
 
-        try:
-            shutil.copytree(source_path, dest_path, dirs_exist_ok=True, copy_function=copy_and_trash_overwritten)
-        except PermissionError:
-            raise PermissionError("No permission")
-        except FileExistsError:
-            raise FileExistsError(f"Destination is a file {dest_path}")
+        if os.path.isdir(source_path):
+            if not argv.r:
+                raise IsADirectoryError("Unable to copy directory without '-r' flag present")
+
+            try:
+                with pool:
+                    pool.copytree(source_path, dest_path, copy_function=copy_and_trash_overwritten)
+            except PermissionError:
+                raise PermissionError("No permission")
+            except FileExistsError:
+                raise FileExistsError(f"Destination is a file {dest_path}")
+
+        journal.commit(operation_id, dest=dest_path, paths=undo_paths)
 
-    add_undo_command('cp', undo_paths)
+    TRASH_WORKER.submit(enforce_trash_policy)
 
     env.log_success(f"Successfully copied {source_path} to {dest_path}")
 
@@ -169,14 +274,20 @@ def cmd_cp(env: CommandEnv, args: list[str]) -> None:
     help="""
         source - file/directory to move/rename
         dest - destination to move/rename file/directory to
+
+        -j N - number of files copied at the same time, when the directory has to be copied
     """
 )
 def cmd_mv(env: CommandEnv, args: list[str]) -> None:
     parser = ArgumentParser(exit_on_error=False)
     parser.add_argument('source')
     parser.add_argument('dest')
+    parser.add_argument('-j', type=int, default=COPY_DEFAULT_JOBS)
     argv = parser.parse_args(args)
 
+    if argv.j < 1:
+        raise ValueError("Number of jobs must be a natural number")
+
     source_path = env.get_path(argv.source)
     validate_path(source_path)
     safety_check_root(source_path)
@@ -188,48 +299,63 @@ def cmd_mv(env: CommandEnv, args: list[str]) -> None:
 
     safety_check_source_in_dest(source_path, dest_path)
 
-    if not os.path.exists(TRASH_DIR):
-        os.makedirs(TRASH_DIR, exist_ok=True)
-
-    undo_prefix = get_undo_prefix()
-    undo_paths: list[str] = [source_path, dest_path]
-
-    copy_and_trash_overwritten = copy_and_trash_overwritten_function(
-        undo_prefix=undo_prefix,
-        dest_path=dest_path,
-        undo_paths=undo_paths,
-        add_all_paths=True  # we need to move all files back to where they were during undo
-    )
-
-    if os.path.isfile(source_path):
-        try:
-            if os.path.isfile(dest_path):
-                ovewritten_trash_name = undo_prefix + os.path.basename(dest_path)
-                ovewritten_trash_path = os.path.join(TRASH_DIR, ovewritten_trash_name)
-
-                shutil.copy2(dest_path, ovewritten_trash_path)
-
-                shutil.copy2(source_path, dest_path)
-                os.remove(source_path)
-            else:
-                os.rename(source_path, dest_path)
-        except PermissionError:
-            raise PermissionError("No permission")
-
-    if os.path.isdir(source_path):
-        try:
-            if not os.path.exists(dest_path):
-                shutil.move(source_path, dest_path)
-            else:
-                #  dont use shutil.move because it cant overwrite, which is different compared to GNU's mv behaviour
-                shutil.copytree(source_path, dest_path, dirs_exist_ok=True, copy_function=copy_and_trash_overwritten)
-                shutil.rmtree(source_path)
-        except PermissionError:
-            raise PermissionError("No permission")
-        except FileExistsError:
-            raise FileExistsError(f"Destination is a file {dest_path}")
-
-    add_undo_command('mv', undo_paths)
+    trash_dir = ensure_trash_dir(dest_path)
+
+    with TRASH_LOCK, UndoJournal() as journal:
+        operation_id = journal.begin('mv')
+
+        undo_prefix = f"{operation_id}_"
+        undo_paths: list[str] = []
+
+        pool = CopyPool(argv.j)
+        copy_and_trash_overwritten = copy_and_trash_overwritten_function(
+            trash_dir=trash_dir,
+            undo_prefix=undo_prefix,
+            dest_path=dest_path,
+            undo_paths=undo_paths,
+            add_all_paths=True,  # we need to move all files back to where they were during undo
+            copy_function=pool.copy,
+        )
+
+        if os.path.isfile(source_path):
+            try:
+                if os.path.isfile(dest_path):
+                    ovewritten_trash_name = undo_prefix + os.path.basename(dest_path)
+                    ovewritten_trash_path = os.path.join(trash_dir, ovewritten_trash_name)
+
+                    trash_overwritten(dest_path, ovewritten_trash_path)
+
+                shutil.move(source_path, dest_path, copy_function=copy2)
+            except PermissionError:
+                raise PermissionError("No permission")
+
+        if os.path.isdir(source_path):
+            try:
+                with pool:
+                    if not os.path.exists(dest_path):
+                        try:
+                            os.rename(source_path, dest_path)
+                        except OSError as e:
+                            if e.errno != errno.EXDEV:
+                                raise
+                            pool.copytree(source_path, dest_path)  # another filesystem, copy and remove
+                            shutil.rmtree(source_path)
+                    elif os.path.isdir(dest_path) and os.stat(source_path).st_dev == os.stat(dest_path).st_dev:
+                        merge_by_rename(source_path, dest_path, trash_dir, undo_prefix, undo_paths)
+                    else:
+                        #  dont use shutil.move because it cant overwrite, which is different compared to GNU's mv behaviour
+                        pool.copytree(source_path, dest_path, copy_function=copy_and_trash_overwritten)
+                        shutil.rmtree(source_path)
+            except PermissionError:
+                raise PermissionError("No permission")
+            except FileExistsError as e:
+                if e.errno is None:  # a conflict found by merge_by_rename, which names the conflicting path
+                    raise
+                raise FileExistsError(f"Destination is a file {dest_path}")
+
+        journal.commit(operation_id, source=source_path, dest=dest_path, paths=undo_paths)
+
+    TRASH_WORKER.submit(enforce_trash_policy)
 
     env.log_success(f"Successfully moved {source_path} to {dest_path}")
 
@@ -270,112 +396,137 @@ def cmd_rm(env: CommandEnv, args: list[str]) -> None:
                 env.log_success("User did not confirm prompt. Done nothing")
                 return
 
-    if not os.path.exists(TRASH_DIR):
-        os.makedirs(TRASH_DIR, exist_ok=True)
+    with TRASH_LOCK, UndoJournal() as journal:
+        operation_id = journal.begin('rm')
 
-    undo_prefix = get_undo_prefix()
+        undo_prefix = f"{operation_id}_"
 
-    trashed_source_name = undo_prefix + os.path.basename(source_path)
-    trashed_source_path = os.path.join(TRASH_DIR, trashed_source_name)
+        trashed_source_name = undo_prefix + os.path.basename(source_path)
+        trashed_source_path = os.path.join(ensure_trash_dir(source_path), trashed_source_name)
 
-    if not argv.test:
-        try:
-            shutil.move(source_path, trashed_source_path)
-        except PermissionError:
-            raise PermissionError("No permission")
+        if not argv.test:
+            try:
+                shutil.move(source_path, trashed_source_path, copy_function=copy2)
+            except PermissionError:
+                raise PermissionError("No permission")
 
-        env.log_success(f"Successfully moved {source_path} to {trashed_source_path}")
-    else:
-        env.log_success("Test flag present. Done nothing")
+            env.log_success(f"Successfully moved {source_path} to {trashed_source_path}")
+        else:
+            env.log_success("Test flag present. Done nothing")
 
-    add_undo_command('rm', [source_path])
+        journal.commit(operation_id, source=source_path)
 
+    TRASH_WORKER.submit(enforce_trash_policy)
 
-@command(
-    name="undo",
-    description="undo last cp, mv, rm command"
-)
-def cmd_undo(env: CommandEnv, args: list[str]) -> None:
-    if not os.path.exists(UNDO_HISTORY_PATH):
-        lines = []
-    else:
-        with open(UNDO_HISTORY_PATH, 'r') as f:
-            lines = f.readlines()
-
-    if not lines:
-        env.print("No more commands to undo!")
-        env.log_success("No commands to undo. Done nothing")
-        return
 
-    undo_count = len(lines)
-    undo_prefix = f"{undo_count}_"
-
-    undo_args = shlex.split(lines.pop())
+def undo_operation(env: CommandEnv, journal: UndoJournal, operation: Operation) -> None:
+    """
+    Отменяет операцию: переносит файлы обратно и восстанавливает файлы из корзины. Журнал не изменяется
+    :param env: Командное окружение
+    :param journal: Журнал операций
+    :param operation: Операция
+    :return: Данная функция ничего не возвращает
+    """
+    trash_path = get_operation_trash_path(operation)
 
-    match undo_args.pop(0):
+    match operation.command:
         case 'cp':
-            dest_path = undo_args.pop(0)
-            files_to_remove = undo_args
+            assert operation.dest is not None
+            dest_path = operation.dest
 
             if os.path.isfile(dest_path):
                 os.remove(dest_path)
             else:
-                for file in files_to_remove:
+                for file in journal.paths(operation.id):
                     os.remove(file)
                     remove_directory_if_empty(os.path.dirname(file))
 
                 if os.path.exists(dest_path):
                     remove_directory_if_empty(dest_path)
 
-            overwritten_name = undo_prefix + os.path.basename(dest_path)
-            overwritten_path = os.path.join(TRASH_DIR, overwritten_name)
-
-            if os.path.exists(overwritten_path):
-                move_and_overwrite(overwritten_path, dest_path)
+            if os.path.exists(trash_path):  # files overwritten by the operation
+                move_and_overwrite(trash_path, dest_path)
 
             env.log_success(f"Successfully undone cp {dest_path}")
         case 'mv':
-            source_path = undo_args.pop(0)
-
-            dest_path = undo_args.pop(0)
-            files_to_move = undo_args
+            assert operation.source is not None and operation.dest is not None
+            source_path = operation.source
+            dest_path = operation.dest
 
             if os.path.isfile(dest_path):
-                shutil.move(dest_path, source_path)
+                shutil.move(dest_path, source_path, copy_function=copy2)
 
             elif os.path.isdir(dest_path):
-                if files_to_move:
-                    for file in files_to_move:
+                if journal.has_paths(operation.id):
+                    for file in journal.paths(operation.id):
                         rel_source_file_path = os.path.relpath(file, dest_path)
                         source_file_path = os.path.join(source_path, rel_source_file_path)
 
                         os.makedirs(os.path.dirname(source_file_path), exist_ok=True)
 
-                        shutil.move(file, source_file_path)
+                        shutil.move(file, source_file_path, copy_function=copy2)
                         remove_directory_if_empty(os.path.dirname(file))
 
                     if os.path.exists(dest_path):
                         remove_directory_if_empty(dest_path)
-                else:  # no files_to_move, that means that directory just got renamed
-                    shutil.move(dest_path, source_path)
-
-            overwritten_name = undo_prefix + os.path.basename(dest_path)
-            overwritten_path = os.path.join(TRASH_DIR, overwritten_name)
+                else:  # no files to move, that means that directory just got renamed
+                    shutil.move(dest_path, source_path, copy_function=copy2)
 
-            if os.path.exists(overwritten_path):
-                move_and_overwrite(overwritten_path, dest_path)
+            if os.path.exists(trash_path):  # files overwritten by the operation
+                move_and_overwrite(trash_path, dest_path)
 
             env.log_success(f"Successfully undone mv {source_path} {dest_path}")
         case 'rm':
-            source_path = undo_args.pop(0)
+            assert operation.source is not None
+            source_path = operation.source
 
-            removed_name = undo_prefix + os.path.basename(source_path)
-            removed_path = os.path.join(TRASH_DIR, removed_name)
+            shutil.move(trash_path, source_path, copy_function=copy2)
 
-            shutil.move(removed_path, source_path)
 
-    with open(UNDO_HISTORY_PATH, 'w') as f:
-        f.writelines(lines)
+@command(
+    name="undo",
+    description="undo last cp, mv, rm commands",
+    help="""
+        count - number of commands to undo, 1 by default
+
+        --to ID - undo all commands starting from the command with number ID
+        --list - list commands that can be undone
+    """
+)
+def cmd_undo(env: CommandEnv, args: list[str]) -> None:
+    parser = ArgumentParser(exit_on_error=False)
+    parser.add_argument('count', nargs='?', type=int, default=1)
+    parser.add_argument('--to', type=int)
+    parser.add_argument('--list', action='store_true')
+    argv = parser.parse_args(args)
+
+    if argv.count < 1:
+        raise ValueError("Number of commands must be a natural number")
+
+    with TRASH_LOCK, UndoJournal() as journal:
+        if argv.list:
+            env.print_lines(
+                f"{operation.id} {operation.command} {shlex.join(filter(None, (operation.source, operation.dest)))}"
+                f" ({journal.count_paths(operation.id)} files)"
+                for operation in journal.operations()
+            )
+            env.log_success()
+            return
+
+        operations = journal.operations(to_id=argv.to) if argv.to is not None else journal.operations(limit=argv.count)
+
+        if not operations:
+            env.print("No more commands to undo!")
+            env.log_success("No commands to undo. Done nothing")
+            return
+
+        undone: list[int] = []
+        try:
+            for operation in operations:  # from the newest one, every operation sees the files as it left them
+                undo_operation(env, journal, operation)
+                undone.append(operation.id)
+        finally:
+            journal.remove(*undone)  # the journal is changed once, even if some operation could not be undone
 
 
 @command(
@@ -383,9 +534,43 @@ def cmd_undo(env: CommandEnv, args: list[str]) -> None:
     description="removes trash and clears undo history"
 )
 def cmd_emptytrash(env: CommandEnv, args: list[str]) -> None:
-    if os.path.exists(TRASH_DIR):
-        shutil.rmtree(TRASH_DIR)
-    os.makedirs(TRASH_DIR, exist_ok=True)
+    empty_trash()
+
+
+@command(
+    name="trashpolicy",
+    description="show or change limits of trash",
+    help="""
+        --max-bytes N - total size of trash in bytes
+        --max-age DAYS - age of the oldest operation that can be undone
+        --max-entries N - number of operations that can be undone
+        --reset - restore the default limits
+
+        When any limit is exceeded, the oldest operations are removed from undo history together with their files in trash
+    """
+)
+def cmd_trashpolicy(env: CommandEnv, args: list[str]) -> None:
+    parser = ArgumentParser(exit_on_error=False)
+    parser.add_argument('--max-bytes', type=int)
+    parser.add_argument('--max-age', type=float)
+    parser.add_argument('--max-entries', type=int)
+    parser.add_argument('--reset', action='store_true')
+    argv = parser.parse_args(args)
+
+    if any(limit is not None and limit < 0 for limit in (argv.max_bytes, argv.max_age, argv.max_entries)):
+        raise ValueError("Limits of trash must not be negative")
+
+    policy = TrashPolicy() if argv.reset else read_trash_policy()
+    if argv.max_bytes is not None:
+        policy = policy._replace(max_bytes=argv.max_bytes)
+    if argv.max_age is not None:
+        policy = policy._replace(max_age=argv.max_age * 24 * 60 * 60)
+    if argv.max_entries is not None:
+        policy = policy._replace(max_entries=argv.max_entries)
+
+    if policy != read_trash_policy():
+        write_trash_policy(policy)
+        TRASH_WORKER.submit(enforce_trash_policy)  # stricter limits apply at once
 
-    if os.path.exists(UNDO_HISTORY_PATH):
-        os.remove(UNDO_HISTORY_PATH)
+    env.print(f"max bytes: {policy.max_bytes}, max age: {policy.max_age / (24 * 60 * 60):g} days, max entries: {policy.max_entries}")
+    env.log_success()
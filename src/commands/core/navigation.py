@@ -1,16 +1,22 @@
 import os
 import stat
+import codecs
 from pwd import getpwuid
 from grp import getgrgid
 
 import datetime
-from typing import NamedTuple
+from collections.abc import Callable, Iterable, Iterator
+from functools import lru_cache
+from itertools import islice
+from typing import Any, BinaryIO, NamedTuple
 
-from src.path import tree
+from src.path import tree_lines
+from src.ignore import IgnoreMatcher
 
 from argparse import ArgumentParser
 from src.command import command, CommandEnv
 from src.path import validate_path
+from src.constants import LS_OWNER_CACHE_SIZE, LS_PAGE_SIZE, CAT_CHUNK_SIZE
 
 
 class TableRow(NamedTuple):
@@ -28,6 +34,22 @@ def local_timezone() -> datetime.tzinfo | None:
     return local_now.tzinfo
 
 
+@lru_cache(maxsize=LS_OWNER_CACHE_SIZE)
+def user_name(uid: int) -> str:
+    try:
+        return getpwuid(uid).pw_name
+    except KeyError:  # no such user, show the id like ls does
+        return str(uid)
+
+
+@lru_cache(maxsize=LS_OWNER_CACHE_SIZE)
+def group_name(gid: int) -> str:
+    try:
+        return getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
 def is_hidden(filename: str) -> bool:
     if filename[0] == '.':
         return True
@@ -40,6 +62,91 @@ def prettify_filename(filename: str) -> str:
     return filename
 
 
+def entry_stat(entry: os.DirEntry) -> os.stat_result:
+    try:
+        return entry.stat(follow_symlinks=True)
+    except OSError:  # broken symbolic link
+        return entry.stat(follow_symlinks=False)
+
+
+def by_name(entry: os.DirEntry) -> str:
+    return entry.name
+
+
+def by_size(entry: os.DirEntry) -> tuple[int, str]:  # largest first
+    return -entry_stat(entry).st_size, entry.name
+
+
+def by_mtime(entry: os.DirEntry) -> tuple[int, str]:  # newest first
+    return -entry_stat(entry).st_mtime_ns, entry.name
+
+
+def list_dir(dir_path: str, show_hidden: bool, sort_key: Callable[[os.DirEntry], Any] | None, reverse: bool) -> Iterator[os.DirEntry]:
+    """
+    Перечисляет файлы директории
+    :param dir_path: Путь к директории
+    :param show_hidden: Показывать скрытые файлы
+    :param sort_key: Ключ сортировки. Если не задан, файлы перечисляются в порядке директории без загрузки всего списка
+    :param reverse: Обратный порядок сортировки
+    :return: Возвращает файлы директории
+    """
+    with os.scandir(dir_path) as scanner:
+        entries = (entry for entry in scanner if show_hidden or not is_hidden(entry.name))
+
+        if sort_key is None:
+            yield from entries
+        else:
+            yield from sorted(entries, key=sort_key, reverse=reverse)
+
+
+def collect_subdirs(entries: Iterable[os.DirEntry], subdirs: list[str]) -> Iterator[os.DirEntry]:
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+        yield entry
+
+
+def make_row(entry: os.DirEntry, timezone: datetime.tzinfo | None) -> TableRow:
+    file_stat = entry_stat(entry)
+
+    return TableRow(
+        permissions=stat.filemode(file_stat.st_mode),
+        user=user_name(file_stat.st_uid),
+        group=group_name(file_stat.st_gid),
+        size=str(file_stat.st_size),
+        modification_time=datetime.datetime.fromtimestamp(file_stat.st_mtime, timezone).strftime('%Y-%m-%d %H:%M:%S'),
+        name=prettify_filename(entry.name),
+    )
+
+
+def format_table(table: list[TableRow]) -> Iterator[str]:
+    max_user_len = max(len(row.user) for row in table)
+    max_group_len = max(len(row.group) for row in table)
+    max_size_len = max(len(row.size) for row in table)
+
+    for row in table:
+        yield f"{row.permissions} {row.user:<{max_user_len}} {row.group:<{max_group_len}} {row.size:<{max_size_len}} {row.modification_time} {row.name}"
+
+
+def ls_lines(entries: Iterable[os.DirEntry], long: bool, page_size: int | None) -> Iterator[str]:
+    """
+    Форматирует список файлов страницами
+    :param entries: Файлы
+    :param long: Выводить файлы таблицей
+    :param page_size: Размер страницы. Ширина столбцов таблицы считается отдельно для каждой страницы.
+    Если не задан, все файлы выводятся одной страницей
+    :return: Возвращает строки вывода
+    """
+    timezone = local_timezone()
+
+    iterator = iter(entries)
+    while page := list(islice(iterator, page_size)):
+        if long:
+            yield from format_table([make_row(entry, timezone) for entry in page])
+        else:
+            yield " ".join(prettify_filename(entry.name) for entry in page)
+
+
 @command(
     name="ls",
     description="list all files in directory",
@@ -48,6 +155,11 @@ def prettify_filename(filename: str) -> str:
 
         -l - list files in table format
         -a - show hidden files
+        -S - sort by size, largest first
+        -t - sort by modification time, newest first
+        -r - reverse the order of sorting
+        -R - list subdirectories recursively
+        -U - do not sort, print files in pages as they are read (for huge directories)
     """
 )
 def cmd_ls(env: CommandEnv, args: list[str]) -> None:
@@ -55,6 +167,11 @@ def cmd_ls(env: CommandEnv, args: list[str]) -> None:
     parser.add_argument('path', nargs='?', default=env.cwd)
     parser.add_argument('-l', action='store_true')
     parser.add_argument('-a', action='store_true')
+    parser.add_argument('-S', action='store_true')
+    parser.add_argument('-t', action='store_true')
+    parser.add_argument('-r', action='store_true')
+    parser.add_argument('-R', action='store_true')
+    parser.add_argument('-U', action='store_true')
     argv = parser.parse_args(args)
 
     dir_path = env.get_path(argv.path)
@@ -63,37 +180,43 @@ def cmd_ls(env: CommandEnv, args: list[str]) -> None:
     if not os.path.isdir(dir_path):
         raise NotADirectoryError(f"Not a directory {dir_path}")
 
-    if not argv.l:
-        env.print(" ".join([prettify_filename(file) for file in os.listdir(dir_path) if not is_hidden(file) or argv.a]))
+    sort_key: Callable[[os.DirEntry], Any] | None
+    if argv.U:
+        sort_key = None
+    elif argv.S:
+        sort_key = by_size
+    elif argv.t:
+        sort_key = by_mtime
     else:
-        table: list[TableRow] = []
+        sort_key = by_name
 
-        max_user_len = 0
-        max_group_len = 0
-        max_size_len = 0
+    page_size = LS_PAGE_SIZE if argv.U else None
 
-        for file in os.scandir(dir_path):
-            if is_hidden(file.name) and not argv.a:
-                continue
+    if not argv.R:
+        env.print_lines(ls_lines(list_dir(dir_path, argv.a, sort_key, argv.r), argv.l, page_size))
+        env.log_success()
+        return
 
-            file_stat = file.stat(follow_symlinks=True)
+    #  directories are listed in the same order as the entries, each one before its subdirectories
+    stack = [dir_path]
+    while stack:
+        path = stack.pop()
+        subdirs: list[str] = []
 
-            row = TableRow(
-                permissions=stat.filemode(file_stat.st_mode),
-                user=getpwuid(file_stat.st_uid).pw_name,
-                group=getgrgid(file_stat.st_gid).gr_name,
-                size=str(file_stat.st_size),
-                modification_time=datetime.datetime.fromtimestamp(file_stat.st_mtime, local_timezone()).strftime('%Y-%m-%d %H:%M:%S'),
-                name=prettify_filename(file.name),
-            )
-            table.append(row)
+        if path == dir_path:
+            env.print(f"{argv.path}:")
+        else:  # paths are shown relative to the argument like in ls
+            env.print()
+            env.print(f"{os.path.join(argv.path, os.path.relpath(path, dir_path))}:")
 
-            max_user_len = max(max_user_len, len(row.user))
-            max_group_len = max(max_group_len, len(row.group))
-            max_size_len = max(max_size_len, len(row.size))
+        try:
+            env.print_lines(ls_lines(collect_subdirs(list_dir(path, argv.a, sort_key, argv.r), subdirs), argv.l, page_size))
+        except PermissionError:
+            if path == dir_path:
+                raise
+            env.print("No permission")
 
-        for row in table:
-            env.print(f"{row.permissions} {row.user:<{max_user_len}} {row.group:<{max_group_len}} {row.size:<{max_size_len}} {row.modification_time} {row.name}")
+        stack.extend(reversed(subdirs))
 
     env.log_success()
 
@@ -121,16 +244,141 @@ def cmd_cd(env: CommandEnv, args: list[str]) -> None:
     env.log_success()
 
 
+def caret_notation(byte: int) -> str:
+    """
+    Отображает байт как в cat -v: управляющие символы как ^X, байты больше 127 с префиксом M-
+    :param byte: Байт
+    :return: Возвращает видимое представление байта
+    """
+    prefix = ""
+    if byte >= 128:
+        prefix = "M-"
+        byte -= 128
+
+    if byte == 127:
+        return prefix + "^?"
+    if byte < 32 and (prefix or chr(byte) not in "\n\t"):
+        return prefix + "^" + chr(byte + 64)
+    return prefix + chr(byte)
+
+
+#  latin-1 maps every byte to the code point with the same value, so str.translate renders a decoded chunk at once
+NONPRINTING_TABLE = {byte: caret_notation(byte) for byte in range(256) if caret_notation(byte) != chr(byte)}
+
+
+def parse_byte_range(byte_range: str) -> tuple[int, int | None]:
+    """
+    Переводит диапазон вида A-B, A- или -B в смещения
+    :param byte_range: Диапазон
+    :return: Возвращает смещение начала и смещение конца (не включительно) или None, если диапазон до конца файла
+    """
+    start, separator, end = byte_range.partition('-')
+    if not separator or not (start + end).isdigit():
+        raise ValueError(f"Invalid byte range {byte_range}")
+
+    range_start = int(start) if start else 0
+    range_end = int(end) if end else None
+    if range_end is not None and range_end < range_start:
+        raise ValueError(f"Invalid byte range {byte_range}")
+
+    return range_start, range_end
+
+
+def read_range(f: BinaryIO, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+    f.seek(start)
+
+    remaining = None if end is None else end - start
+    while remaining is None or remaining > 0:
+        chunk = f.read(CAT_CHUNK_SIZE if remaining is None else min(CAT_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def read_head(f: BinaryIO, lines: int) -> Iterator[bytes]:
+    if lines <= 0:
+        return
+
+    for chunk in read_range(f):
+        count = chunk.count(b'\n')
+        if count < lines:
+            lines -= count
+            yield chunk
+            continue
+
+        end = -1
+        for _ in range(lines):
+            end = chunk.index(b'\n', end + 1)
+        yield chunk[:end + 1]
+        return
+
+
+def tail_offset(f: BinaryIO, lines: int) -> int:
+    """
+    Находит начало последних строк файла, читая его блоками с конца
+    :param f: Файл
+    :param lines: Количество строк
+    :return: Возвращает смещение первой из последних строк
+    """
+    size = f.seek(0, os.SEEK_END)
+    if lines <= 0:
+        return size
+
+    newlines = 0
+    position = size
+    while position > 0:
+        read_size = min(CAT_CHUNK_SIZE, position)
+        position -= read_size
+        f.seek(position)
+        chunk = f.read(read_size)
+
+        end = len(chunk)
+        if position + end == size and chunk.endswith(b'\n'):  # the final newline ends the last line
+            end -= 1
+
+        while (i := chunk.rfind(b'\n', 0, end)) != -1:
+            newlines += 1
+            if newlines == lines:
+                return position + i + 1
+            end = i
+
+    return 0
+
+
+def render_chunks(chunks: Iterable[bytes], show_nonprinting: bool, errors: str = 'strict') -> Iterator[str]:
+    if show_nonprinting:
+        for chunk in chunks:
+            yield chunk.decode('latin-1').translate(NONPRINTING_TABLE)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors)  # keeps characters split between chunks
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
 @command(
     name="cat",
     description="print contents of file",
     help="""
         file - file to print contents of
+
+        --head N - print the first N lines
+        --tail N - print the last N lines
+        --bytes A-B - print bytes from offset A up to offset B, either can be omitted
+        -v - show non-printing characters (^X, M-X), allows binary files
     """
 )
 def cmd_cat(env: CommandEnv, args: list[str]) -> None:
     parser = ArgumentParser(exit_on_error=False)
     parser.add_argument('file')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--head', type=int)
+    group.add_argument('--tail', type=int)
+    group.add_argument('--bytes')
+    parser.add_argument('-v', action='store_true')
     argv = parser.parse_args(args)
 
     file_path = env.get_path(argv.file)
@@ -140,12 +388,28 @@ def cmd_cat(env: CommandEnv, args: list[str]) -> None:
         raise FileNotFoundError(f"Not a file {file_path}")
 
     try:
-        with open(file_path, 'r') as f:
-            contents = f.read()
-            contents = contents.rstrip('\n')
-            env.print(contents)
+        with open(file_path, 'rb') as f:
+            errors = 'strict'
+            if argv.head is not None:
+                chunks = read_head(f, argv.head)
+            elif argv.tail is not None:
+                chunks = read_range(f, tail_offset(f, argv.tail))
+            elif argv.bytes is not None:
+                chunks = read_range(f, *parse_byte_range(argv.bytes))
+                errors = 'replace'  # the range can cut a character in half
+            else:
+                chunks = read_range(f)
+
+            last_text = ""
+            for text in render_chunks(chunks, argv.v, errors):
+                if text:
+                    env.write(text)
+                    last_text = text
+
+            if last_text and not last_text.endswith('\n'):
+                env.write('\n')
     except UnicodeDecodeError:  # binary file
-        raise ValueError("Not a text file or a non-unicode encoding")
+        raise ValueError("Not a text file or a non-unicode encoding, use -v to show it")
     except PermissionError:
         raise PermissionError("No permission")
 
@@ -157,12 +421,20 @@ def cmd_cat(env: CommandEnv, args: list[str]) -> None:
     description="print directory as a sorted tree",
     help="""
         path - path to print tree of
+
+        -L depth - descend only depth directories deep
+        -l - follow symbolic links to directories
+        --filelimit N - do not descend into directories with more than N entries
+        --gitignore - hide files and directories listed in .gitignore/.ignore files
     """
 )
 def cmd_tree(env: CommandEnv, args: list[str]) -> None:
     parser = ArgumentParser(exit_on_error=False)
     parser.add_argument('path', nargs='?', default=env.cwd)
+    parser.add_argument('-L', type=int, dest='max_depth')
     parser.add_argument('-l', action='store_true')
+    parser.add_argument('--filelimit', type=int)
+    parser.add_argument('--gitignore', action='store_true')
     argv = parser.parse_args(args)
 
     dir_path = env.get_path(argv.path)
@@ -171,7 +443,15 @@ def cmd_tree(env: CommandEnv, args: list[str]) -> None:
     if not os.path.isdir(dir_path):
         raise NotADirectoryError(f"Not a directory {dir_path}")
 
-    tree_result = tree(dir_path)
-    env.print(tree_result)
+    if argv.max_depth is not None and argv.max_depth < 1:
+        raise ValueError("Invalid level, must be greater than 0")
+
+    env.print_lines(tree_lines(
+        dir_path,
+        ignore=IgnoreMatcher.for_root(dir_path) if argv.gitignore else None,
+        max_depth=argv.max_depth,
+        file_limit=argv.filelimit,
+        follow_symlinks=argv.l,
+    ))
 
     env.log_success()
@@ -1,8 +1,201 @@
+import io
 import os
+import sys
+import glob
+import time
 import shutil
+import fnmatch
+import tarfile
+import zlib
+import zipfile
+
+from collections.abc import Iterable, Iterator, Sequence
+from typing import BinaryIO, Literal, NamedTuple, cast
 
 from argparse import ArgumentParser
 from src.command import command, CommandEnv, Command
+from src.ignore import walk_with_ignores
+from src.parallel_deflate import ParallelZipWriter, ParallelGzipWriter
+from src.archive_manifest import get_manifest_path, get_temp_manifest_path, read_manifest, write_manifest, find_changes
+from src.constants import ARCHIVE_PROGRESS_INTERVAL, ARCHIVE_DELETIONS_NAME
+
+try:
+    from compression import zstd  # type: ignore[import-not-found]
+except ImportError:  # added to the standard library in Python 3.14
+    zstd = None
+
+
+class ArchiveFormat(NamedTuple):
+    extension: str
+    compression: str | None  # tarfile mode suffix, None for zip
+    levels: range | None  # valid compression levels, None if the format does not compress
+    parallel: bool  # compressed in blocks by several threads with -j
+
+
+XzPreset = Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+TAR_DEFAULT_COMPRESSLEVEL = 9  # the default of tarfile.open for gz and bz2
+
+
+#  names are the same as in shutil.get_archive_formats()
+ARCHIVE_FORMATS = {
+    'zip': ArchiveFormat('zip', None, range(0, 10), True),
+    'tar': ArchiveFormat('tar', '', None, False),
+    'gztar': ArchiveFormat('tar.gz', 'gz', range(0, 10), True),
+    'bztar': ArchiveFormat('tar.bz2', 'bz2', range(1, 10), False),
+    'xztar': ArchiveFormat('tar.xz', 'xz', range(0, 10), False),
+}
+if zstd is not None:
+    min_level, max_level = zstd.CompressionParameter.compression_level.bounds()
+    ARCHIVE_FORMATS['zstdtar'] = ArchiveFormat('tar.zst', 'zst', range(min_level, max_level + 1), False)
+
+
+def iter_archive_members(source_path: str, dest_path: str, ignore: bool) -> Iterator[tuple[str, str]]:
+    """
+    Обходит директорию в отсортированном порядке для архивации
+    :param source_path: Путь к директории
+    :param dest_path: Путь к архиву, который пропускается, если он создается внутри директории
+    :param ignore: Пропускать файлы и директории из .gitignore/.ignore
+    :return: Возвращает путь и имя в архиве для каждого файла и директории
+    """
+    for root, dirs, files in walk_with_ignores(source_path, ignore):
+        dirs.sort()
+        for name in dirs + sorted(files):
+            path = os.path.join(root, name)
+            if path != dest_path:
+                yield path, os.path.relpath(path, source_path)
+
+
+def validate_compression(format: str, level: int | None, store: bool, jobs: int = 1) -> None:
+    archive_format = ARCHIVE_FORMATS[format]
+
+    if jobs < 1:
+        raise ValueError("Number of jobs must be a natural number")
+    if jobs > 1 and not archive_format.parallel:
+        raise ValueError(f"Parallel compression is not supported by {format}")
+
+    if store and archive_format.compression:
+        raise ValueError(f"Unable to store files without compression in {format}, use zip or tar")
+    if level is None:
+        return
+
+    levels = archive_format.levels
+    if store or levels is None:
+        raise ValueError(f"Compression level is not supported by {format} without compression")
+    if level not in levels:
+        raise ValueError(f"Compression level of {format} must be from {levels.start} to {levels.stop - 1}")
+
+
+def add_deletions(archive: zipfile.ZipFile | tarfile.TarFile, deleted: Sequence[str]) -> None:
+    data = "".join(name + '\n' for name in deleted).encode()
+
+    if isinstance(archive, zipfile.ZipFile):
+        archive.writestr(ARCHIVE_DELETIONS_NAME, data)
+    else:
+        info = tarfile.TarInfo(ARCHIVE_DELETIONS_NAME)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        archive.addfile(info, io.BytesIO(data))
+
+
+def open_tar(dest_path: str, compression: str | None, level: int | None) -> tarfile.TarFile:
+    """
+    Открывает tar архив на запись. У каждого сжатия в tarfile.open свой аргумент уровня
+    :param dest_path: Путь к архиву
+    :param compression: Сжатие из ArchiveFormat
+    :param level: Уровень сжатия, None - уровень по умолчанию
+    :return: Возвращает открытый архив
+    """
+    if compression == 'gz':
+        return tarfile.open(dest_path, 'w:gz', compresslevel=TAR_DEFAULT_COMPRESSLEVEL if level is None else level)
+    if compression == 'bz2':
+        return tarfile.open(dest_path, 'w:bz2', compresslevel=TAR_DEFAULT_COMPRESSLEVEL if level is None else level)
+    if compression == 'xz':
+        return tarfile.open(dest_path, 'w:xz', preset=cast(XzPreset | None, level))  # checked by validate_compression
+    if compression == 'zst' and sys.version_info >= (3, 14):
+        options: dict[int, int] | None = {zstd.CompressionParameter.compression_level: level} if level is not None else None
+        return tarfile.open(dest_path, 'w:zst', options=options)
+    return tarfile.open(dest_path, 'w')
+
+
+def write_archive(
+    dest_path: str,
+    format: str,
+    source_path: str,
+    ignore: bool,
+    level: int | None = None,
+    store: bool = False,
+    jobs: int = 1,
+    members: Iterable[tuple[str, str]] | None = None,
+    deleted: Sequence[str] | None = None,
+) -> None:
+    """
+    Архивирует содержимое директории аналогично shutil.make_archive
+    :param dest_path: Путь к архиву с расширением
+    :param format: Формат архива из ARCHIVE_FORMATS
+    :param source_path: Путь к директории
+    :param ignore: Пропускать файлы и директории из .gitignore/.ignore
+    :param level: Уровень сжатия, по умолчанию уровень библиотеки сжатия
+    :param store: Сохранять файлы в zip без сжатия, для уже сжатых файлов
+    :param jobs: Количество потоков, которые сжимают zip и gztar
+    :param members: Пути и имена в архиве, по умолчанию все содержимое директории
+    :param deleted: Имена, удаленные с прошлого архива. Если задано, архив является дельтой и список записывается в него первым
+    :return: Данная функция ничего не возвращает
+    """
+    archive_format = ARCHIVE_FORMATS[format]
+    parallel = jobs > 1 and not store
+
+    if members is None:
+        members = iter_archive_members(source_path, dest_path, ignore)
+
+    if archive_format.compression is None:
+        compression = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(dest_path, 'w', compression=compression, compresslevel=level) as zip_archive:
+            if deleted is not None:
+                add_deletions(zip_archive, deleted)
+
+            zip_members = ((path, arcname) for path, arcname in members if os.path.isdir(path) or os.path.isfile(path))
+            if parallel:
+                with ParallelZipWriter(zip_archive, jobs, level) as writer:
+                    for path, arcname in zip_members:
+                        writer.write(path, arcname)
+            else:
+                for path, arcname in zip_members:
+                    zip_archive.write(path, arcname)
+    elif parallel:  # gztar, the tar stream is compressed by the writer
+        with ParallelGzipWriter(dest_path, jobs, zlib.Z_DEFAULT_COMPRESSION if level is None else level) as gzip_file:
+            with tarfile.open(fileobj=gzip_file, mode='w|') as tar_archive:  # type: ignore[call-overload]
+                if deleted is not None:
+                    add_deletions(tar_archive, deleted)
+                for path, arcname in members:
+                    tar_archive.add(path, arcname, recursive=False)
+    else:
+        with open_tar(dest_path, archive_format.compression, level) as tar_archive:
+            if deleted is not None:
+                add_deletions(tar_archive, deleted)
+            for path, arcname in members:
+                tar_archive.add(path, arcname, recursive=False)
+
+
+def get_delta_path(dest_path: str, format: str, number: int) -> str:
+    return f"{dest_path}.{number}.{ARCHIVE_FORMATS[format].extension}"
+
+
+def get_chain_paths(base_path: str, format: str) -> list[str]:
+    """
+    Находит дельты инкрементального архива: <имя>.1.<расширение>, <имя>.2.<расширение> и т.д.
+    :param base_path: Путь к полному архиву
+    :param format: Формат архива
+    :return: Возвращает путь к полному архиву и пути к дельтам в порядке их создания
+    """
+    extension = '.' + ARCHIVE_FORMATS[format].extension
+    if not base_path.endswith(extension):
+        raise ValueError(f"Archive name must end with {extension}")
+
+    dest_path = base_path[:-len(extension)]
+    paths = [base_path]
+    while os.path.exists(delta_path := get_delta_path(dest_path, format, len(paths))):
+        paths.append(delta_path)
+    return paths
 
 
 def archive_command(format: str) -> Command:
@@ -12,14 +205,29 @@ def archive_command(format: str) -> Command:
         help=f"""
             source - directory to {format}
             dest - destination of {format} archived directory
+
+            --gitignore - skip files and directories listed in .gitignore/.ignore files
+            --level N - compression level
+            --store - do not compress files, for already compressed files (zip)
+            -j N - number of threads compressing the archive (zip, gztar)
+            --incremental - if the archive exists, create dest.N archive only with files changed since the previous one
         """
     )
     def cmd_archive(env: CommandEnv, args: list[str]) -> None:
         parser = ArgumentParser(exit_on_error=False)
         parser.add_argument('source')
         parser.add_argument('dest', nargs='?')
+        parser.add_argument('--gitignore', action='store_true')
+        parser.add_argument('--level', type=int)
+        parser.add_argument('--store', action='store_true')
+        parser.add_argument('-j', type=int)
+        parser.add_argument('--incremental', action='store_true')
         argv = parser.parse_args(args)
 
+        if argv.j is None:  # compressing is bound by CPU
+            argv.j = (os.cpu_count() or 1) if ARCHIVE_FORMATS[format].parallel else 1
+        validate_compression(format, argv.level, argv.store, argv.j)
+
         source_path = env.get_path(argv.source)
         if not os.path.isdir(source_path):
             raise NotADirectoryError(f"Not a directory {source_path}")
@@ -29,26 +237,224 @@ def archive_command(format: str) -> Command:
         else:
             dest_path = env.get_path(argv.dest)
 
-        dest_path_with_format = dest_path + '.' + format
-        if os.path.exists(dest_path_with_format):
+        dest_path_with_format = dest_path + '.' + ARCHIVE_FORMATS[format].extension
+        manifest_path = get_manifest_path(dest_path_with_format)
+        delta = argv.incremental and os.path.exists(manifest_path) and os.path.exists(dest_path_with_format)
+        if os.path.exists(dest_path_with_format) and not delta:
             raise FileExistsError(f"Destination exists {dest_path_with_format}")
 
+        archive_path = dest_path_with_format
+        members = None
+        deleted = None
+        if argv.incremental:
+            old_manifest = read_manifest(manifest_path) if delta else {}
+            chain_paths = get_chain_paths(dest_path_with_format, format) if delta else [dest_path_with_format]
+            if delta:
+                archive_path = get_delta_path(dest_path, format, len(chain_paths))
+
+            #  the archives and the manifest of the chain, when it is created inside the directory
+            excluded = {*chain_paths, archive_path, manifest_path, get_temp_manifest_path(manifest_path)}
+            all_members = iter_archive_members(source_path, dest_path_with_format, argv.gitignore)
+            changes = find_changes(((path, name) for path, name in all_members if path not in excluded), old_manifest)
+            members = changes.members
+            deleted = changes.deleted if delta else None
+
         try:
-            shutil.make_archive(
-                base_name=dest_path,
-                format=format,
-                root_dir=source_path
+            write_archive(
+                archive_path,
+                format,
+                source_path,
+                ignore=argv.gitignore,
+                level=argv.level,
+                store=argv.store,
+                jobs=argv.j,
+                members=members,
+                deleted=deleted,
             )
-        except PermissionError:
-            raise PermissionError("No permission")
+        except BaseException as e:
+            if os.path.exists(archive_path):  # a partial archive would block the next run or break the chain
+                os.remove(archive_path)
+            if isinstance(e, PermissionError):
+                raise PermissionError("No permission")
+            raise
 
-        env.log_success(f"Successfully {format} archived {source_path} to {dest_path_with_format}")
+        if argv.incremental:  # written only after the archive, so a failed archive leaves the previous manifest
+            write_manifest(manifest_path, changes.manifest)
+            env.log_success(
+                f"Successfully {format} archived {len(changes.members)} changed and {len(changes.deleted)} deleted"
+                f" files of {source_path} to {archive_path}"
+            )
+        else:
+            env.log_success(f"Successfully {format} archived {source_path} to {archive_path}")
 
     return cmd_archive
 
 
 cmd_zip = archive_command('zip')
 cmd_tar = archive_command('tar')
+cmd_gztar = archive_command('gztar')
+cmd_bztar = archive_command('bztar')
+cmd_xztar = archive_command('xztar')
+if zstd is not None:
+    cmd_zstdtar = archive_command('zstdtar')
+
+
+class ProgressReader:
+    """
+    Обертка над файлом архива, которая считает прочитанные байты и периодически выводит скорость распаковки
+    """
+    def __init__(self, file: BinaryIO, env: CommandEnv, total: int):
+        self.file = file
+        self.env = env
+        self.total = total
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    def __getattr__(self, name: str):  # seek, tell and the rest are used by zipfile
+        return getattr(self.file, name)
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.file.read(size)
+        self.done += len(data)  # not the position, zipfile reads the central directory at the end first
+
+        now = time.monotonic()
+        if now - self.last_report >= ARCHIVE_PROGRESS_INTERVAL:
+            self.last_report = now
+            self.env.print(format_progress(self.done, self.total, now - self.start))
+        return data
+
+    def summary(self) -> str:
+        return format_progress(self.done, self.total, time.monotonic() - self.start)
+
+
+def format_progress(done: int, total: int, elapsed: float) -> str:
+    percent = done * 100 // total if total else 100
+    rate = done / elapsed if elapsed > 0 else 0
+    return f"{done / 1024 ** 2:.1f}/{total / 1024 ** 2:.1f} MiB ({percent}%), {rate / 1024 ** 2:.1f} MiB/s"
+
+
+class MemberSelector:
+    """
+    Выбирает члены архива по glob паттернам. Паттерн выбирает и все содержимое директории с подходящим именем
+    """
+    def __init__(self, patterns: list[str]):
+        self.patterns = [pattern.rstrip('/') for pattern in patterns]
+        self.unmatched = set(self.patterns)
+        self.start_archive()
+
+    def matching_patterns(self, name: str) -> list[str]:
+        name = name.rstrip('/')
+        return [
+            pattern for pattern in self.patterns
+            if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(name, pattern + '/*')
+        ]
+
+    def select(self, name: str, is_dir: bool) -> bool:
+        if not self.patterns:
+            return True
+
+        patterns = self.matching_patterns(name)
+        for pattern in patterns:
+            self.unmatched.discard(pattern)
+            if name == pattern and not is_dir:
+                self.literal_files.discard(pattern)
+        return bool(patterns)
+
+    def start_archive(self) -> None:
+        """
+        Начинает следующий архив цепочки, в котором файлы могут быть найдены снова
+        :return: Данная функция ничего не возвращает
+        """
+        #  files named without glob characters, after they are found the rest of a tar stream is not read
+        self.literal_files = {pattern for pattern in self.patterns if not glob.has_magic(pattern)}
+
+    def done(self) -> bool:
+        return bool(self.patterns) and not self.literal_files and all(not glob.has_magic(p) for p in self.patterns)
+
+
+def apply_deletions(data: bytes, selector: MemberSelector, extract_dir: str) -> None:
+    """
+    Удаляет из директории распаковки имена, удаленные с прошлого архива цепочки
+    :param data: Список имен из дельты архива
+    :param selector: Выбор членов архива, удаляются только выбранные имена
+    :param extract_dir: Директория распаковки
+    :return: Данная функция ничего не возвращает
+    """
+    for name in data.decode().splitlines():
+        if selector.patterns and not selector.matching_patterns(name):
+            continue
+
+        path = os.path.normpath(os.path.join(extract_dir, name))
+        if os.path.commonpath([path, extract_dir]) != extract_dir or path == extract_dir:
+            raise ValueError(f"Deleted name is outside of the destination {name}")
+
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+
+def list_zip(archive: zipfile.ZipFile, selector: MemberSelector) -> Iterator[str]:
+    for info in archive.infolist():
+        if info.filename != ARCHIVE_DELETIONS_NAME and selector.select(info.filename, info.is_dir()):
+            yield f"{info.file_size:>12} {info.filename}"
+
+
+def list_tar(archive: tarfile.TarFile, selector: MemberSelector) -> Iterator[str]:
+    for member in archive:
+        if member.name != ARCHIVE_DELETIONS_NAME and selector.select(member.name, member.isdir()):
+            yield f"{member.size:>12} {member.name}{'/' if member.isdir() else ''}"
+        if selector.done():
+            break
+
+
+def extract_zip(archive: zipfile.ZipFile, selector: MemberSelector, extract_dir: str) -> int:
+    """
+    Распаковывает выбранные члены zip архива. Центральный каталог читается один раз при открытии архива
+    :param archive: Архив
+    :param selector: Выбор членов архива
+    :param extract_dir: Директория, в которую распаковывается архив
+    :return: Возвращает количество распакованных членов
+    """
+    if ARCHIVE_DELETIONS_NAME in archive.NameToInfo:  # a delta of an incremental archive
+        apply_deletions(archive.read(ARCHIVE_DELETIONS_NAME), selector, extract_dir)
+
+    count = 0
+    for info in archive.infolist():
+        if info.filename != ARCHIVE_DELETIONS_NAME and selector.select(info.filename, info.is_dir()):
+            archive.extract(info, extract_dir)
+            count += 1
+    return count
+
+
+def extract_tar(archive: tarfile.TarFile, selector: MemberSelector, extract_dir: str) -> int:
+    """
+    Распаковывает выбранные члены tar архива, читая архив последовательно один раз.
+    Если все файлы названы без glob символов, чтение останавливается, когда они найдены
+    :param archive: Архив, открытый в потоковом режиме
+    :param selector: Выбор членов архива
+    :param extract_dir: Директория, в которую распаковывается архив
+    :return: Возвращает количество распакованных членов
+    """
+    count = 0
+
+    def selected_members() -> Iterator[tarfile.TarInfo]:
+        nonlocal count
+        for member in archive:
+            if member.name == ARCHIVE_DELETIONS_NAME:  # the first member of a delta of an incremental archive
+                deletions = archive.extractfile(member)
+                assert deletions is not None
+                apply_deletions(deletions.read(), selector, extract_dir)
+            elif selector.select(member.name, member.isdir()):
+                count += 1
+                yield member
+            if selector.done():
+                return
+
+    #  extractall sets the attributes of directories after their contents, so their mtimes and read-only modes survive
+    archive.extractall(extract_dir, members=selected_members(), filter='data')
+    return count
 
 
 def extract_command(format: str) -> Command:
@@ -57,36 +463,73 @@ def extract_command(format: str) -> Command:
         description=f"un{format} archive",
         help=f"""
             source - file to un{format}
+            members - names or glob patterns of files and directories to extract, everything by default
+
+            -C dest - directory to extract to, current directory by default
+            --list - list members instead of extracting them
+            --chain - extract the incremental archive with all its source.N deltas in order
         """
     )
     def cmd_extract(env: CommandEnv, args: list[str]) -> None:
         parser = ArgumentParser(exit_on_error=False)
         parser.add_argument('source')
-        argv = parser.parse_args(args)
+        parser.add_argument('members', nargs='*')
+        parser.add_argument('-C', dest='extract_dir')
+        parser.add_argument('--list', action='store_true')
+        parser.add_argument('--chain', action='store_true')
+        argv = parser.parse_intermixed_args(args)  # members can follow -C
 
         source_path = env.get_path(argv.source)
         if not os.path.isfile(source_path):
             raise IsADirectoryError(f"Not a file {source_path}")
 
-        try:
-            if format == 'zip':
-                shutil.unpack_archive(
-                    filename=source_path,
-                    extract_dir=env.cwd
-                )
-            elif format == 'tar':
-                shutil.unpack_archive(
-                    filename=source_path,
-                    extract_dir=env.cwd,
-                    filter='data'
-                )
-        except PermissionError:
-            raise PermissionError("No permission")
-        except shutil.ReadError:
-            raise shutil.ReadError(f"Unable to un{format} {source_path}")
+        extract_dir = env.get_path(argv.extract_dir) if argv.extract_dir else env.cwd
+        if not os.path.isdir(extract_dir):
+            raise NotADirectoryError(f"Not a directory {extract_dir}")
+
+        archive_paths = get_chain_paths(source_path, format) if argv.chain else [source_path]
+
+        selector = MemberSelector(argv.members)
+        count = 0
+        for archive_path in archive_paths:
+            selector.start_archive()
+            try:
+                with open(archive_path, 'rb') as f:
+                    reader = ProgressReader(f, env, os.fstat(f.fileno()).st_size)
+
+                    if format == 'zip':
+                        with zipfile.ZipFile(reader) as zip_archive:  # type: ignore[arg-type]
+                            reader.done = 0  # only the members are counted
+                            if argv.list:
+                                env.print_lines(list_zip(zip_archive, selector))
+                            else:
+                                count += extract_zip(zip_archive, selector, extract_dir)
+                    else:  # stream mode reads the archive once from the beginning, compression is detected
+                        with tarfile.open(fileobj=reader, mode='r|*') as tar_archive:  # type: ignore[call-overload]
+                            if argv.list:
+                                env.print_lines(list_tar(tar_archive, selector))
+                            else:
+                                count += extract_tar(tar_archive, selector, extract_dir)
+            except PermissionError:
+                raise PermissionError("No permission")
+            except (zipfile.BadZipFile, tarfile.ReadError, tarfile.CompressionError):
+                raise shutil.ReadError(f"Unable to un{format} {archive_path}")
+
+        if selector.unmatched:
+            raise FileNotFoundError(f"Not found in archive: {', '.join(sorted(selector.unmatched))}")
+
+        if argv.list:
+            env.log_success()
+        else:
+            env.log_success(f"Successfully extracted {count} members of {source_path} to {extract_dir}, {reader.summary()}")
 
     return cmd_extract
 
 
 cmd_unzip = extract_command('zip')
 cmd_untar = extract_command('tar')
+cmd_ungztar = extract_command('gztar')
+cmd_unbztar = extract_command('bztar')
+cmd_unxztar = extract_command('xztar')
+if zstd is not None:
+    cmd_unzstdtar = extract_command('zstdtar')
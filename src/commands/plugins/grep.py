@@ -1,50 +1,528 @@
 import os
+import stat
+import mmap
+import codecs
+import multiprocessing
 
 import re
+from fnmatch import fnmatchcase
+
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import islice
+from typing import TypeVar
 
 from argparse import ArgumentParser
 from src.command import command, CommandEnv
 from src.path import validate_path
+from src.ignore import walk_with_ignores
+from src.trigram_index import TrigramIndex, get_index_path
 
 from src.constants import GREP_MATCH_PADDING
+from src.constants import GREP_BATCH_SIZE, GREP_WINDOW_PER_JOB
+from src.constants import GREP_SNIFF_SIZE, GREP_DECODE_CHUNK_SIZE, GREP_SKIPPED_EXTENSIONS, GREP_SKIPPED_DIRS
+
+
+REGEX_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+OCTAL_DIGITS = frozenset('01234567')
+
+#  escapes whose meaning depends on unicode or on the whole line being the subject, and char codes,
+#  which are code points in a str pattern but single bytes in a bytes pattern
+BYTES_UNSAFE_ESCAPES = frozenset('AZBbdDsSwWx01234567')
+INLINE_FLAGS = frozenset('aiLmsux-')
+
+Buffer = bytes | mmap.mmap
+T = TypeVar('T')
 
+SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
 
-def find_patterns_in_file(pattern: str, file: str, ignore_case: bool) -> str:
+
+def parse_size(size: str) -> int:
     """
-    Находит паттерны в файле
-    :param pattern: Паттерн, который нужно найти
-    :param file: Путь к файлу
+    Переводит размер вида 100, 10K, 5M, 1G в байты
+    :param size: Размер
+    :return: Возвращает размер в байтах
+    """
+    suffix = size[-1:].upper() if size[-1:].isalpha() else ''
+    if suffix not in SIZE_SUFFIXES:
+        raise ValueError(f"Invalid size {size}")
+
+    number = int(size[:len(size) - len(suffix)])
+    if number < 0:
+        raise ValueError(f"Invalid size {size}")
+
+    return number * SIZE_SUFFIXES[suffix]
+
+
+class FileFilter:
+    """
+    Правила, по которым рекурсивный grep пропускает файлы и директории, не открывая их
+    """
+    def __init__(
+        self,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        exclude_dir: list[str] | None = None,
+        max_filesize: int | None = None,
+        skip_binary: bool = True
+    ):
+        self.include = include or []
+        self.exclude = exclude or []
+        self.exclude_dir = exclude_dir or []
+        self.max_filesize = max_filesize
+        self.skip_binary = skip_binary
+
+    def accepts_dir(self, name: str) -> bool:
+        if self.skip_binary and name in GREP_SKIPPED_DIRS:
+            return False
+        return not any(fnmatchcase(name, glob) for glob in self.exclude_dir)
+
+    def accepts_file(self, name: str, path: str) -> bool:
+        if self.skip_binary and name.lower().endswith(GREP_SKIPPED_EXTENSIONS):
+            return False
+        if self.include and not any(fnmatchcase(name, glob) for glob in self.include):
+            return False
+        if any(fnmatchcase(name, glob) for glob in self.exclude):
+            return False
+
+        if self.max_filesize is not None:
+            try:
+                return os.stat(path).st_size <= self.max_filesize
+            except OSError:
+                return False
+
+        return True
+
+
+def extract_literal_prefix(pattern: str) -> str:
+    """
+    Находит литеральный префикс паттерна, который обязан присутствовать в каждом совпадении
+    :param pattern: Regex паттерн
+    :return: Возвращает префикс или пустую строку, если его нельзя выделить
+    """
+    if '|' in pattern:  # alternation can make any part of the pattern optional
+        return ""
+
+    prefix: list[str] = []
+    for char in pattern:
+        if char in REGEX_METACHARACTERS:
+            if char in '*?{' and prefix:  # the last char is quantified and might not be present
+                prefix.pop()
+            break
+        prefix.append(char)
+
+    return "".join(prefix)
+
+
+def compile_bytes_regex(pattern: str, ignore_case: bool) -> re.Pattern[bytes] | None:
+    """
+    Компилирует паттерн для поиска по байтам, если каждое совпадение в строке текста также будет совпадением в байтах
+    :param pattern: Regex паттерн
     :param ignore_case: Игнорировать регистр или нет
+    :return: Возвращает скомпилированный паттерн или None, если паттерн нельзя применить к байтам
+    """
+    #  '.' and negated classes match a single byte instead of a whole character,
+    #  '$' does not match before "\r\n" and case folding of non-ascii characters is lost
+    if ignore_case or not pattern.isascii() or '.' in pattern or '$' in pattern or '[^' in pattern:
+        return None
+
+    for i in range(len(pattern) - 1):
+        if pattern[i] == '\\' and pattern[i + 1] in BYTES_UNSAFE_ESCAPES:
+            return None
+        if pattern[i] == '(' and pattern[i + 1] == '?' and pattern[i + 2:i + 3] in INLINE_FLAGS:
+            return None
+
+    try:
+        return re.compile(pattern.encode(), re.MULTILINE)
+    except re.error:
+        return None
+
+
+def has_inline_flags(pattern: str) -> bool:
+    return any(pattern[i:i + 2] == '(?' and pattern[i + 2:i + 3] in INLINE_FLAGS for i in range(len(pattern)))
+
+
+def find_class_end(pattern: str, start: int) -> int:
+    """
+    Находит конец символьного класса, пропуская экранированные символы
+    :param pattern: Regex паттерн
+    :param start: Позиция '[', которая открывает класс
+    :return: Возвращает позицию закрывающей ']' или -1, если класс не закрыт
+    """
+    i = start + 1
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':  # the first ']' of a class is a literal char
+        i += 1
+
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 2
+            continue
+        if pattern[i] == ']':
+            return i
+        i += 1
+
+    return -1
+
+
+def find_escape_end(pattern: str, start: int) -> int:
+    """
+    Находит конец escape последовательности вместе с ее телом: \\x41, \\u0041, \\N{...}, восьмеричные коды, обратные ссылки
+    :param pattern: Regex паттерн
+    :param start: Позиция '\\'
+    :return: Возвращает позицию после escape последовательности
+    """
+    i = start + 1
+    char = pattern[i:i + 1]
+    body_lengths = {'x': 2, 'u': 4, 'U': 8}
+
+    if char in body_lengths:
+        return min(i + 1 + body_lengths[char], len(pattern))
+    if char == 'N' and pattern[i + 1:i + 2] == '{':
+        end = pattern.find('}', i)
+        return len(pattern) if end == -1 else end + 1
+    if char == '0':  # octal, up to two more octal digits
+        end = i + 1
+        while end < min(i + 3, len(pattern)) and pattern[end] in OCTAL_DIGITS:
+            end += 1
+        return end
+    if char.isdigit():  # three octal digits are an octal escape, otherwise a backreference of one or two digits
+        if len(pattern[i:i + 3]) == 3 and all(digit in OCTAL_DIGITS for digit in pattern[i:i + 3]):
+            return i + 3
+        return i + 2 if pattern[i + 1:i + 2].isdigit() else i + 1
+    return i + 1
+
+
+def extract_required_literals(pattern: str) -> list[str]:
+    """
+    Находит литеральные строки паттерна, которые обязаны присутствовать в каждом совпадении
+    :param pattern: Regex паттерн
+    :return: Возвращает список строк или пустой список, если их нельзя выделить
+    """
+    if '|' in pattern or has_inline_flags(pattern):  # alternation and flags can change what is required
+        return []
+
+    literals: list[str] = []
+    current: list[str] = []
+
+    def flush() -> None:
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if depth == 0 and escaped and not escaped.isalnum():  # escaped punctuation is a literal char
+                current.append(escaped)
+                i += 2
+            else:  # a class, an assertion or a char given by its code
+                flush()
+                i = find_escape_end(pattern, i)
+            continue
+
+        if char == '[':  # skip the whole character class
+            i = find_class_end(pattern, i)
+            if i == -1:
+                break
+            flush()
+        elif char == '(':
+            depth += 1
+            flush()
+        elif char == ')':
+            depth -= 1
+        elif char in '*?{':  # the last char is quantified and might not be present
+            if current:
+                current.pop()
+            flush()
+            if char == '{':
+                i = pattern.find('}', i)
+                if i == -1:
+                    break
+        elif char == '+':  # the last char is required, but might be repeated
+            flush()
+        elif char in '.^$':
+            flush()
+        elif depth == 0:
+            current.append(char)
+
+        i += 1
+
+    flush()
+    return literals
+
+
+class SearchPlan:
+    """
+    Паттерн поиска, подготовленный один раз для всех файлов
+    """
+    def __init__(self, pattern: str, ignore_case: bool):
+        self.regex = re.compile(pattern, re.IGNORECASE if ignore_case else re.NOFLAG)
+
+        self.literal: str | None = None
+        self.prefix = ""
+        if not ignore_case:
+            if pattern and not REGEX_METACHARACTERS.intersection(pattern):
+                self.literal = pattern
+            self.prefix = extract_literal_prefix(pattern)
+
+        #  every match contains all of these, so files without any of them can be skipped
+        self.literals = [literal.encode() for literal in extract_required_literals(pattern)] if not ignore_case else []
+        self.required = max(self.literals, key=len, default=b"")
+        if self.literal is not None:
+            self.bytes_regex: re.Pattern[bytes] | None = re.compile(re.escape(self.literal.encode()))
+        else:
+            self.bytes_regex = compile_bytes_regex(pattern, ignore_case)
+
+    def finditer(self, line: str) -> Iterator[tuple[int, int]]:
+        """
+        Находит все непересекающиеся совпадения в строке
+        :param line: Строка
+        :return: Возвращает начало и конец каждого совпадения
+        """
+        if self.literal is not None:  # plain substring search is much faster than regex
+            start = line.find(self.literal)
+            while start != -1:
+                end = start + len(self.literal)
+                yield start, end
+                start = line.find(self.literal, end)
+            return
+
+        if self.prefix and self.prefix not in line:
+            return
+
+        for match in self.regex.finditer(line):
+            yield match.span()
+
+
+def format_matches(plan: SearchPlan, file: str, line_number: int, line: str) -> Iterator[str]:
+    """
+    Находит паттерны в строке
+    :param plan: Подготовленный паттерн поиска
+    :param file: Путь к файлу
+    :param line_number: Номер строки
+    :param line: Строка без символа переноса
     :return: Возвращает строчки с названием файла, номером строки и найденым паттерном, обернутым в ковычки
     """
-    found = ""
-    line_count = 0
+    for start, end in plan.finditer(line):
+        left_pad = line[max(0, start - GREP_MATCH_PADDING):start]
+        if start - GREP_MATCH_PADDING > 0:
+            left_pad = '...' + left_pad
+
+        right_pad = line[end:min(end + GREP_MATCH_PADDING, len(line))]
+        if end + GREP_MATCH_PADDING < len(line):
+            right_pad = right_pad + '...'
+
+        match_str = f'{left_pad}"{line[start:end]}"{right_pad}'
 
-    flag = re.NOFLAG
-    if ignore_case:
-        flag = re.IGNORECASE
+        yield f"{file}:{line_number} -> {match_str}"
+
+
+def candidate_lines(plan: SearchPlan, buffer: Buffer) -> Iterator[tuple[int, int]]:
+    """
+    Находит строки файла, в которых может быть совпадение, не декодируя файл
+    :param plan: Подготовленный паттерн поиска
+    :param buffer: Содержимое файла
+    :return: Возвращает начало и конец (без символа переноса) каждой строки по возрастанию
+    """
+    if plan.required and buffer.find(plan.required) == -1:
+        return
 
+    if plan.bytes_regex is None:  # unable to locate matches on the byte level, every line is a candidate
+        spans: Iterable[tuple[int, int]] = [(0, len(buffer))]
+    else:
+        spans = (match.span() for match in plan.bytes_regex.finditer(buffer))
+
+    next_line_start = 0
+    for span_start, span_end in spans:
+        if span_start < next_line_start:
+            if span_end <= next_line_start:  # span lies in lines that were already yielded
+                continue
+            line_start = next_line_start
+        else:
+            line_start = max(next_line_start, buffer.rfind(b'\n', next_line_start, span_start) + 1)
+
+        while line_start <= span_end and line_start < len(buffer):
+            line_end = buffer.find(b'\n', line_start)
+            if line_end == -1:
+                line_end = len(buffer)
+
+            yield line_start, line_end
+            line_start = next_line_start = line_end + 1
+
+
+def is_utf8(buffer: Buffer) -> bool:
+    decoder = codecs.getincrementaldecoder('utf-8')()
     try:
-        with open(file, 'r') as f:
-            for line in f:
-                line_count += 1
-                line = line.rstrip('\n')
-                for match in re.finditer(pattern, line, flag):
-                    left_pad = line[max(0, match.start(0) - GREP_MATCH_PADDING):match.start(0)]
-                    if match.start(0) - GREP_MATCH_PADDING > 0:
-                        left_pad = '...' + left_pad
-
-                    right_pad = line[match.end(0):min(match.end(0) + GREP_MATCH_PADDING, len(line))]
-                    if match.end(0) + GREP_MATCH_PADDING < len(line):
-                        right_pad = right_pad + '...'
-
-                    match_str = f'{left_pad}"{match.group(0)}"{right_pad}'
-
-                    found_str = f"{file}:{line_count} -> {match_str}\n"
-                    found += found_str
-        return found
-    except UnicodeDecodeError:  # binary file, skip
-        return ""
+        for start in range(0, len(buffer), GREP_DECODE_CHUNK_SIZE):  # the decoded text is not kept
+            decoder.decode(buffer[start:start + GREP_DECODE_CHUNK_SIZE])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def find_patterns_in_buffer(plan: SearchPlan, file: str, buffer: Buffer) -> Iterator[str]:
+    """
+    Находит паттерны в содержимом файла. Файл, который не декодируется в utf-8, пропускается целиком:
+    перед первым совпадением проверяется весь файл, чтобы его вывод не обрывался на середине
+    :param plan: Подготовленный паттерн поиска
+    :param file: Путь к файлу
+    :param buffer: Содержимое файла
+    :return: Возвращает строчки с названием файла, номером строки и найденым паттерном, обернутым в ковычки
+    """
+    line_number = 1
+    counted_until = 0
+    checked = False
+    for line_start, line_end in candidate_lines(plan, buffer):
+        line_number += buffer[counted_until:line_start].count(b'\n')
+        counted_until = line_start
+
+        try:
+            line = buffer[line_start:line_end].decode('utf-8')
+        except UnicodeDecodeError:  # binary file, skip it
+            return
+        if line.endswith('\r'):
+            line = line[:-1]
+
+        matches = list(format_matches(plan, file, line_number, line))
+        if matches and not checked:
+            if not is_utf8(buffer):
+                return
+            checked = True
+
+        yield from matches
+
+
+def is_binary(buffer: Buffer) -> bool:
+    return buffer.find(b'\0', 0, GREP_SNIFF_SIZE) != -1
+
+
+def find_patterns_in_file(plan: SearchPlan, file: str, skip_binary: bool = True) -> Iterator[str]:
+    """
+    Находит паттерны в файле. Файл отображается в память целиком, декодируются только строки с совпадениями
+    :param plan: Подготовленный паттерн поиска
+    :param file: Путь к файлу
+    :param skip_binary: Пропускать файл, если в его начале есть нулевые байты
+    :return: Возвращает строчки с названием файла, номером строки и найденым паттерном, обернутым в ковычки, по мере нахождения
+    """
+    with open(file, 'rb') as f:
+        file_stat = os.fstat(f.fileno())
+        if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size == 0:  # unable to mmap, file is small or special
+            contents = f.read()
+            if not (skip_binary and is_binary(contents)):
+                yield from find_patterns_in_buffer(plan, file, contents)
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if not (skip_binary and is_binary(buffer)):
+                yield from find_patterns_in_buffer(plan, file, buffer)
+
+
+def find_patterns_in_files(plan: SearchPlan, files: list[str], skip_binary: bool = True) -> list[str]:
+    """
+    Находит паттерны в нескольких файлах. Используется как задача для пула процессов
+    :param plan: Подготовленный паттерн поиска
+    :param files: Список путей к файлам
+    :param skip_binary: Пропускать бинарные файлы
+    :return: Возвращает результаты find_patterns_in_file для всех файлов в том же порядке
+    """
+    return [found for file in files for found in find_patterns_in_file(plan, file, skip_binary)]
+
+
+def walk_files(path: str, file_filter: FileFilter | None = None, ignore: bool = False) -> Iterator[str]:
+    """
+    Рекурсивно обходит директорию в отсортированном порядке
+    :param path: Путь к директории
+    :param file_filter: Правила пропуска файлов и директорий
+    :param ignore: Пропускать файлы и директории из .gitignore/.ignore
+    :return: Возвращает пути к файлам в детерминированном порядке
+    """
+    file_filter = file_filter or FileFilter()
+
+    for root, dirs, files in walk_with_ignores(path, ignore):
+        #  os.walk descends into dirs in the order they are left in the list, skipped dirs are never listed
+        dirs[:] = sorted(dir for dir in dirs if file_filter.accepts_dir(dir))
+
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            if file_filter.accepts_file(file, file_path):
+                yield file_path
+
+
+def batched(items: Iterable[str], size: int) -> Iterator[list[str]]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def ordered_map(executor: Executor, function: Callable[..., T], args: Iterable[tuple], window: int) -> Iterator[T]:
+    """
+    Аналог executor.map, который не ставит в очередь все задачи сразу
+    :param executor: Пул, в котором выполняются задачи
+    :param function: Функция задачи
+    :param args: Агрументы для каждой задачи
+    :param window: Максимальное количество одновременно запущенных задач
+    :return: Возвращает результаты задач в порядке агрументов
+    """
+    pending: deque[Future[T]] = deque()
+
+    for task_args in args:
+        pending.append(executor.submit(function, *task_args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def search_files(plan: SearchPlan, files: Iterable[str], jobs: int, skip_binary: bool = True) -> Iterator[str]:
+    """
+    Ищет паттерны в файлах, распределяя их по пулу процессов
+    :param plan: Подготовленный паттерн поиска
+    :param files: Пути к файлам
+    :param jobs: Количество процессов. При 1 поиск выполняется в текущем процессе
+    :param skip_binary: Пропускать бинарные файлы
+    :return: Возвращает найденные строчки в порядке файлов
+    """
+    if jobs == 1:
+        for file in files:
+            yield from find_patterns_in_file(plan, file, skip_binary)
+        return
+
+    #  fork would copy the locks of the other threads (the trash worker) in whatever state they are
+    executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('forkserver'))
+    try:
+        tasks = ((plan, batch, skip_binary) for batch in batched(files, GREP_BATCH_SIZE))
+        for found in ordered_map(executor, find_patterns_in_files, tasks, window=jobs * GREP_WINDOW_PER_JOB):
+            yield from found
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def index_candidates(path: str, files: Iterable[str], plan: SearchPlan, skip_binary: bool = True) -> Iterable[str]:
+    """
+    Обновляет индекс триграмм директории и отбирает файлы, которые могут содержать совпадения.
+    Индекс обновляется по всем файлам директории, как командой index, иначе фильтры grep удалили бы из него остальные файлы
+    :param path: Путь к директории
+    :param files: Пути к файлам, прошедшим фильтры grep
+    :param plan: Подготовленный паттерн поиска
+    :param skip_binary: Не индексировать бинарные файлы, архивы и директории VCS
+    :return: Возвращает пути к файлам, которые нужно просмотреть
+    """
+    with TrigramIndex(path) as index:
+        index.update(walk_files(path, FileFilter(skip_binary=skip_binary)))
+        candidates = index.candidates(plan.literals)
+
+    if candidates is None:
+        return files
+    return (file for file in files if file in candidates)
 
 
 @command(
@@ -56,6 +534,14 @@ def find_patterns_in_file(pattern: str, file: str, ignore_case: bool) -> str:
 
         -r - recursively search contents of directory
         -i - case insensitive search
+        -j N - number of worker processes for recursive search (default: number of CPUs)
+        -a - also search binary files, archives, build artifacts and VCS directories
+        --include GLOB - search only files whose name matches GLOB (can be repeated)
+        --exclude GLOB - skip files whose name matches GLOB (can be repeated)
+        --exclude-dir GLOB - skip directories whose name matches GLOB (can be repeated)
+        --max-filesize SIZE - skip files larger than SIZE (e.g. 500K, 10M, 1G)
+        --gitignore - skip files and directories listed in .gitignore/.ignore files
+        --index - narrow down files with the trigram index of the directory, creating or updating it first (case sensitive search only)
     """
 )
 def cmd_grep(env: CommandEnv, args: list[str]) -> None:
@@ -64,29 +550,88 @@ def cmd_grep(env: CommandEnv, args: list[str]) -> None:
     parser.add_argument('path')
     parser.add_argument('-r', action='store_true')
     parser.add_argument('-i', action='store_true')
+    parser.add_argument('-j', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('-a', action='store_true')
+    parser.add_argument('--include', action='append')
+    parser.add_argument('--exclude', action='append')
+    parser.add_argument('--exclude-dir', action='append')
+    parser.add_argument('--max-filesize', type=parse_size)
+    parser.add_argument('--gitignore', action='store_true')
+    parser.add_argument('--index', action='store_true')
     argv = parser.parse_args(args)
 
+    if argv.j <= 0:
+        raise ValueError("Number of jobs must be a natural number")
+
     path = env.get_path(argv.path)
     validate_path(path)
 
-    found = ""
+    plan = SearchPlan(argv.pattern, argv.i)
+    found_count = 0
 
     try:
         if os.path.isfile(path):
-            found = find_patterns_in_file(argv.pattern, path, argv.i)
+            found_count = env.print_lines(find_patterns_in_file(plan, path, skip_binary=not argv.a))
         elif os.path.isdir(path):
             if not argv.r:
                 raise IsADirectoryError("Unable to recursively search directory without '-r' flag present")
 
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    found += find_patterns_in_file(argv.pattern, os.path.join(root, file), argv.i)
+            file_filter = FileFilter(
+                include=argv.include,
+                exclude=argv.exclude,
+                exclude_dir=argv.exclude_dir,
+                max_filesize=argv.max_filesize,
+                skip_binary=not argv.a
+            )
+            files: Iterable[str] = walk_files(path, file_filter, ignore=argv.gitignore)
+            if argv.index:
+                files = index_candidates(path, files, plan, skip_binary=not argv.a)
+
+            found_count = env.print_lines(search_files(plan, files, argv.j, skip_binary=not argv.a))
     except PermissionError:
         raise PermissionError("No permission")
 
-    found = found.rstrip('\n')
-    if found:
-        env.print(found)
+    if found_count:
         env.log_success()
     else:
         env.log_success("No patterns found")
+
+
+@command(
+    name="index",
+    description="create or update trigram index of directory used by grep --index",
+    help="""
+        path - directory to index
+
+        -a - also index binary files, archives, build artifacts and VCS directories
+        --drop - remove index of directory
+    """
+)
+def cmd_index(env: CommandEnv, args: list[str]) -> None:
+    parser = ArgumentParser(exit_on_error=False)
+    parser.add_argument('path', nargs='?', default=env.cwd)
+    parser.add_argument('-a', action='store_true')
+    parser.add_argument('--drop', action='store_true')
+    argv = parser.parse_args(args)
+
+    path = env.get_path(argv.path)
+    validate_path(path)
+
+    if not os.path.isdir(path):
+        raise NotADirectoryError(f"Not a directory {path}")
+
+    if argv.drop:
+        index_path = get_index_path(path)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        env.log_success(f"Removed index of {path}")
+        return
+
+    try:
+        with TrigramIndex(path) as index:
+            paths, reindexed, removed = index.update(walk_files(path, FileFilter(skip_binary=not argv.a)))
+    except PermissionError:
+        raise PermissionError("No permission")
+
+    env.print(f"Indexed {len(paths)} files: {reindexed} updated, {removed} removed")
+    env.log_success(f"Indexed {path}")
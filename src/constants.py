@@ -2,12 +2,60 @@ import os
 
 DEBUG = False
 
+OUTPUT_BUFFER_LINES = 64
+OUTPUT_FLUSH_INTERVAL = 0.1  # seconds
+OUTPUT_RING_SIZE = 64 * 1024  # characters of output kept by the 'ring' capture mode
+
+LS_OWNER_CACHE_SIZE = 4096  # uid/gid to name lookups kept between ls calls
+LS_PAGE_SIZE = 1024  # entries per page printed by unsorted ls
+CAT_CHUNK_SIZE = 64 * 1024
+
+MOUNT_TRASH_DIR_NAME = ".Trash-{uid}"  # trash directory in the root of other filesystems, like in the XDG trash specification
+TRASH_PURGE_SUFFIX = ".purge"  # directory next to a trash directory, where its contents are moved before being deleted in background
+
 GREP_MATCH_PADDING = 25
+GREP_BATCH_SIZE = 64  # files per task sent to a grep worker process
+GREP_WINDOW_PER_JOB = 4  # tasks queued per grep worker process
+GREP_SNIFF_SIZE = 8192  # files with a NUL byte in the first block are binary
+GREP_DECODE_CHUNK_SIZE = 1024 ** 2  # a file with a match is checked to be utf-8 by chunks of this size
+GREP_SKIPPED_DIRS = (
+    '.git', '.hg', '.svn', '.grep_index', '__pycache__',
+    '.trash', '.trash' + TRASH_PURGE_SUFFIX,
+    MOUNT_TRASH_DIR_NAME.format(uid=os.getuid()), MOUNT_TRASH_DIR_NAME.format(uid=os.getuid()) + TRASH_PURGE_SUFFIX,
+)
+GREP_SKIPPED_EXTENSIONS = (
+    '.o', '.a', '.so', '.dll', '.dylib', '.exe', '.class', '.pyc', '.pyo', '.whl', '.jar',
+    '.zip', '.tar', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.pdf',
+    '.mp3', '.mp4', '.mkv', '.avi', '.mov', '.wav', '.flac',
+)
+
+COPY_DEFAULT_JOBS = 8  # threads copying files in cp -r and mv, copying is bound by I/O latency rather than CPU
+COPY_WINDOW_PER_JOB = 16  # file copies queued per copy thread
+
+ARCHIVE_BLOCK_SIZE = 128 * 1024  # uncompressed bytes compressed by one thread in zip -j and gztar -j, like in pigz
+ARCHIVE_WINDOW_PER_JOB = 8  # blocks queued per compressing thread
+ARCHIVE_PROGRESS_INTERVAL = 1.0  # seconds between progress lines of unzip/untar
+ARCHIVE_MANIFEST_SUFFIX = ".manifest"  # file next to an incremental archive with sizes, times and hashes of archived files
+ARCHIVE_DELETIONS_NAME = ".archive_deletions"  # first member of a delta archive, names deleted since the previous archive
+
+TRASH_MAX_BYTES = 10 * 1024 ** 3  # oldest undo entries and their trash are deleted when any limit is exceeded
+TRASH_MAX_AGE = 30 * 24 * 60 * 60  # seconds
+TRASH_MAX_ENTRIES = 1000
+
+IGNORE_FILES = ('.gitignore', '.ignore')
+ALWAYS_IGNORED_DIRS = ('.git',)
+
+INDEX_MAX_FILESIZE = 16 * 1024 ** 2  # larger files are not indexed and always searched
+INDEX_OVERLAY_MAX_FILES = 1000  # changed files kept aside before their trigrams are merged into postings
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 TRASH_DIR = os.path.join(ROOT_DIR, ".trash")
+TRASH_ROOTS_PATH = os.path.join(ROOT_DIR, ".trash_roots")  # trash directories created on other filesystems
+TRASH_POLICY_PATH = os.path.join(ROOT_DIR, ".trash_policy")  # limits of the trash set with trashpolicy, the defaults above otherwise
 COMMAND_HISTORY_PATH = os.path.join(ROOT_DIR, ".history")
 UNDO_HISTORY_PATH = os.path.join(ROOT_DIR, ".undo_history")
+INDEX_DIR = os.path.join(ROOT_DIR, ".grep_index")
 
 TEST_SANDBOX_DIR = os.path.join(ROOT_DIR, "test_sandbox")
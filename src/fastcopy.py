@@ -0,0 +1,213 @@
+import os
+import stat
+import errno
+import shutil
+
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.constants import COPY_WINDOW_PER_JOB
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+#  errors which mean that a method can not copy this pair of files, the next method is tried instead
+UNSUPPORTED_ERRORS = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.EPERM)
+
+COPY_CHUNK_SIZE = 1 << 30  # bytes requested per copy_file_range/sendfile call, they stop at the end of the file
+
+
+def clone_file(src_fd: int, dst_fd: int) -> bool:
+    """
+    Создает reflink копию файла (btrfs, XFS), которая разделяет блоки данных с оригиналом
+    :param src_fd: Дескриптор исходного файла
+    :param dst_fd: Дескриптор пустого конечного файла
+    :return: Возвращает True, если файл склонирован
+    """
+    if fcntl is None:
+        return False
+
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRORS:
+            return False
+        raise
+
+    return True
+
+
+def copy_with_syscall(copy_function: Callable[[int, int, int], int], src_fd: int, dst_fd: int, size: int) -> bool:
+    """
+    Копирует файл от текущих позиций дескрипторов системным вызовом, который копирует данные внутри ядра
+    :param copy_function: os.copy_file_range или os.sendfile
+    :param src_fd: Дескриптор исходного файла
+    :param dst_fd: Дескриптор конечного файла
+    :param size: Размер исходного файла
+    :return: Возвращает True, если файл скопирован полностью, и False, если вызов не поддерживается
+    или закончил копирование раньше размера файла (так бывает в procfs, sysfs, FUSE и сетевых файловых системах).
+    Во втором случае позиции дескрипторов указывают, сколько уже скопировано
+    """
+    try:
+        while copy_function(src_fd, dst_fd, COPY_CHUNK_SIZE):
+            pass
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRORS:
+            return False
+        raise
+
+    return os.lseek(src_fd, 0, os.SEEK_CUR) >= size
+
+
+def sendfile(src_fd: int, dst_fd: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, None, count)
+
+
+def copy_file_range(src_fd: int, dst_fd: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count)
+
+
+def copyfile(src: str, dst: str, *, follow_symlinks: bool = True) -> str:
+    """
+    Аналог shutil.copyfile, который копирует данные без буферов в памяти процесса.
+    Пробует reflink клонирование, затем copy_file_range, затем sendfile и только затем shutil
+    :param src: Путь к исходному файлу
+    :param dst: Путь к конечному файлу
+    :param follow_symlinks: Если False, символическая ссылка копируется как ссылка
+    :return: Возвращает путь к конечному файлу
+    """
+    if not follow_symlinks and os.path.islink(src):
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        os.symlink(os.readlink(src), dst)
+        return dst
+
+    src_stat = os.stat(src)
+    #  pipes, devices and files like in /proc, which report zero size, are left to shutil
+    if not stat.S_ISREG(src_stat.st_mode) or src_stat.st_size == 0:
+        return shutil.copyfile(src, dst)
+
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src} and {dst} are the same file")
+
+    with open(src, 'rb', buffering=0) as fsrc, open(dst, 'wb', buffering=0) as fdst:
+        src_fd = fsrc.fileno()
+        dst_fd = fdst.fileno()
+
+        if clone_file(src_fd, dst_fd):
+            return dst
+        if hasattr(os, 'copy_file_range') and copy_with_syscall(copy_file_range, src_fd, dst_fd, src_stat.st_size):
+            return dst
+        if hasattr(os, 'sendfile') and copy_with_syscall(sendfile, src_fd, dst_fd, src_stat.st_size):
+            return dst
+
+        #  from the start, like shutil does when copy_file_range copies nothing, a short copy may have skipped data
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst)
+
+    return dst
+
+
+def copy2(src: str, dst: str, *, follow_symlinks: bool = True) -> str:
+    """
+    Аналог shutil.copy2, который копирует данные через copyfile
+    :param src: Путь к исходному файлу
+    :param dst: Путь к конечному файлу или директории
+    :param follow_symlinks: Если False, символическая ссылка копируется как ссылка
+    :return: Возвращает путь к конечному файлу
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    copyfile(src, dst, follow_symlinks=follow_symlinks)
+    shutil.copystat(src, dst, follow_symlinks=follow_symlinks)
+    return dst
+
+
+CopyFunction = Callable[..., str]
+
+
+def raise_error(error: OSError) -> None:
+    raise error
+
+
+class CopyPool:
+    """
+    Копирует файлы в пуле потоков. Количество ожидающих копирований ограничено
+    """
+    def __init__(self, jobs: int = 1):
+        self.jobs = jobs
+        self.executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.pending: deque[Future] = deque()
+
+    def __enter__(self) -> "CopyPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def copy(self, src: str, dst: str, *, follow_symlinks: bool = True) -> str:
+        """
+        Аналог copy2, который ставит копирование в очередь пула
+        :param src: Путь к исходному файлу
+        :param dst: Путь к конечному файлу
+        :param follow_symlinks: Если False, символическая ссылка копируется как ссылка
+        :return: Возвращает путь к конечному файлу
+        """
+        if self.executor is None:
+            return copy2(src, dst, follow_symlinks=follow_symlinks)
+
+        while len(self.pending) >= self.jobs * COPY_WINDOW_PER_JOB:
+            self.pending.popleft().result()
+
+        self.pending.append(self.executor.submit(copy2, src, dst, follow_symlinks=follow_symlinks))
+        return dst
+
+    def wait(self) -> None:
+        """
+        Дожидается всех копирований
+        :return: Данная функция ничего не возвращает. Если копирование не удалось, вызывает его исключение
+        """
+        while self.pending:
+            self.pending.popleft().result()
+
+    def copytree(self, source: str, dest: str, copy_function: CopyFunction | None = None) -> str:
+        """
+        Аналог shutil.copytree(dirs_exist_ok=True). Сначала создаются все директории в отсортированном порядке,
+        затем файлы передаются copy_function в том же порядке, а права и время директорий копируются после всех файлов
+        :param source: Путь к исходной директории
+        :param dest: Путь к конечной директории
+        :param copy_function: Функция копирования файла, по умолчанию self.copy. Вызывается в текущем потоке
+        :return: Возвращает путь к конечной директории
+        """
+        copy_function = copy_function or self.copy
+
+        dirs: list[tuple[str, str]] = []
+        files: list[tuple[str, str]] = []
+
+        #  like copytree with symlinks=False, and unreadable directories are errors instead of being skipped
+        for root, dir_names, file_names in os.walk(source, onerror=raise_error, followlinks=True):
+            dir_names.sort()
+            dest_root = dest if root == source else os.path.join(dest, os.path.relpath(root, source))
+
+            os.makedirs(dest_root, exist_ok=True)
+            dirs.append((root, dest_root))
+            files += [(os.path.join(root, name), os.path.join(dest_root, name)) for name in sorted(file_names)]
+
+        for src, dst in files:
+            copy_function(src, dst)
+        self.wait()
+
+        for src, dst in reversed(dirs):  # creating files changes the time of their directory
+            shutil.copystat(src, dst)
+
+        return dest
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import os
+import re
+
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from src.constants import IGNORE_FILES, ALWAYS_IGNORED_DIRS
+
+
+class IgnoreRule(NamedTuple):
+    base_dir: str
+    regex: re.Pattern[str]
+    anchored: bool  # match the path relative to base_dir instead of the name
+    negated: bool
+    dir_only: bool
+
+
+def translate_glob(glob: str) -> str:
+    """
+    Переводит glob паттерн из .gitignore в regex
+    :param glob: Паттерн
+    :return: Возвращает regex, который должен полностью совпасть с путем
+    """
+    result = []
+
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+
+        if glob.startswith('**/', i) and (i == 0 or glob[i - 1] == '/'):  # zero or more directories
+            result.append('(?:.*/)?')
+            i += 3
+            continue
+        if glob.startswith('/**', i) and i + 3 == len(glob):  # everything inside
+            result.append('/.*')
+            i += 3
+            continue
+
+        if char == '*':
+            while glob.startswith('*', i + 1):
+                i += 1
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[' and (end := glob.find(']', i + 2)) != -1:
+            char_class = glob[i + 1:end].replace('\\', '\\\\')
+            if char_class[0] == '!':
+                char_class = '^' + char_class[1:]
+            result.append(f'[{char_class}]')
+            i = end
+        elif char == '\\' and i + 1 < len(glob):
+            i += 1
+            result.append(re.escape(glob[i]))
+        else:
+            result.append(re.escape(char))
+
+        i += 1
+
+    return "".join(result)
+
+
+def parse_ignore_file(path: str) -> list[IgnoreRule]:
+    """
+    Читает правила из файла в формате .gitignore
+    :param path: Путь к файлу
+    :return: Возвращает список правил в порядке их объявления
+    """
+    base_dir = os.path.dirname(path)
+    rules = []
+
+    try:
+        with open(path, 'r', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    for line in lines:
+        if line.endswith(' ') and not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            continue
+
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+
+        anchored = '/' in line  # patterns with a slash are relative to the directory of the ignore file
+        line = line.lstrip('/')
+
+        rules.append(IgnoreRule(
+            base_dir=base_dir,
+            regex=re.compile(translate_glob(line), re.DOTALL),
+            anchored=anchored,
+            negated=negated,
+            dir_only=dir_only,
+        ))
+
+    return rules
+
+
+def find_repository_root(path: str) -> str | None:
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+class IgnoreMatcher:
+    """
+    Правила игнорирования для директории: правила из ее .gitignore/.ignore и из всех родительских директорий
+    """
+    def __init__(self, rules: tuple[IgnoreRule, ...] = ()):
+        self.rules = rules
+
+    @classmethod
+    def for_root(cls, root: str) -> IgnoreMatcher:
+        """
+        Создает правила для директории, начиная с корня git репозитория, если она в нем находится
+        :param root: Путь к директории
+        :return: Возвращает правила игнорирования
+        """
+        repository_root = find_repository_root(root) or root
+
+        dirs = [root]
+        while dirs[-1] != repository_root:
+            dirs.append(os.path.dirname(dirs[-1]))
+
+        matcher = cls()
+        for dir in reversed(dirs):
+            matcher = matcher.child(dir)
+        return matcher
+
+    def child(self, dir_path: str) -> IgnoreMatcher:
+        """
+        Добавляет правила из .gitignore/.ignore директории
+        :param dir_path: Путь к поддиректории
+        :return: Возвращает правила игнорирования поддиректории
+        """
+        rules: list[IgnoreRule] = []
+        for name in IGNORE_FILES:
+            rules += parse_ignore_file(os.path.join(dir_path, name))
+
+        if not rules:
+            return self
+        return IgnoreMatcher(self.rules + tuple(rules))
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        Проверяет, игнорируется ли путь. Побеждает последнее подходящее правило
+        :param path: Путь к файлу или директории
+        :param is_dir: Является ли путь директорией
+        :return: Возвращает True, если путь игнорируется
+        """
+        name = os.path.basename(path)
+        if is_dir and name in ALWAYS_IGNORED_DIRS:
+            return True
+
+        ignored = False
+        for rule in self.rules:
+            if rule.negated != ignored or (rule.dir_only and not is_dir):
+                continue  # rule cannot change the result
+
+            if rule.anchored:
+                base_prefix = os.path.join(rule.base_dir, '')
+                if not path.startswith(base_prefix):
+                    continue
+                subject = path[len(base_prefix):].replace(os.sep, '/')
+            else:
+                subject = name
+
+            if rule.regex.fullmatch(subject):
+                ignored = not rule.negated
+
+        return ignored
+
+
+def walk_with_ignores(top: str, ignore: bool = True) -> Iterator[tuple[str, list[str], list[str]]]:
+    """
+    Аналог os.walk, который не спускается в игнорируемые директории и пропускает игнорируемые файлы.
+    Как и в os.walk, директории, удаленные из списка dirs, не обходятся
+    :param top: Путь к директории
+    :param ignore: Применять правила из .gitignore/.ignore
+    :return: Возвращает путь к директории, имена поддиректорий и имена файлов
+    """
+    if not ignore:
+        yield from os.walk(top)
+        return
+
+    parents = {top: IgnoreMatcher.for_root(top)}
+
+    for root, dirs, files in os.walk(top):
+        matcher = parents.pop(root)
+        if root != top:
+            matcher = matcher.child(root)
+
+        dirs[:] = [dir for dir in dirs if not matcher.is_ignored(os.path.join(root, dir), is_dir=True)]
+        files[:] = [file for file in files if not matcher.is_ignored(os.path.join(root, file), is_dir=False)]
+
+        yield root, dirs, files
+
+        for dir in dirs:
+            parents[os.path.join(root, dir)] = matcher
@@ -1,6 +1,7 @@
 import readline  # provides line editing and history features for `input()`
 
 from src.shell import Shell
+from src.command import CAPTURE_OFF
 
 
 def main() -> None:
@@ -11,7 +12,7 @@ def main() -> None:
 
     readline.set_auto_history(True)
 
-    shell = Shell()
+    shell = Shell(capture=CAPTURE_OFF)  # output is only read from the terminal
     shell.run()
 
 
@@ -0,0 +1,221 @@
+import os
+import time
+import zlib
+import struct
+import zipfile
+
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src.constants import ARCHIVE_BLOCK_SIZE, ARCHIVE_WINDOW_PER_JOB
+
+
+DICTIONARY_SIZE = 32 * 1024  # deflate window, the end of the previous block primes the next one
+
+GZIP_HEADER = b"\x1f\x8b\x08\x00"  # magic, deflate, no flags
+GZIP_OS_UNKNOWN = 255
+
+
+def deflate_block(data: bytes, level: int, dictionary: bytes, last: bool) -> bytes:
+    """
+    Сжимает блок в raw deflate так, что блоки можно склеить в один поток (как в pigz).
+    Все блоки, кроме последнего, заканчиваются Z_SYNC_FLUSH на границе байта
+    :param data: Несжатый блок
+    :param level: Уровень сжатия
+    :param dictionary: Конец предыдущего блока, на который могут ссылаться совпадения в этом блоке
+    :param last: Является ли блок последним в потоке
+    :return: Возвращает сжатый блок
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class OrderedPool:
+    """
+    Выполняет функции в пуле потоков, а их результаты передает обработчикам в текущем потоке в порядке добавления.
+    Количество ожидающих задач ограничено
+    """
+    def __init__(self, jobs: int):
+        self.window = jobs * ARCHIVE_WINDOW_PER_JOB
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.pending: deque[tuple[Future | None, Callable[..., object]]] = deque()
+        self.running = 0
+
+    def __enter__(self) -> "OrderedPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, callback: Callable[[bytes], object], function: Callable[..., bytes], *args) -> None:
+        while self.running >= self.window:
+            self.process_next()
+
+        self.pending.append((self.executor.submit(function, *args), callback))
+        self.running += 1
+
+    def then(self, callback: Callable[[], None]) -> None:
+        """
+        Добавляет обработчик, который вызывается после обработчиков всех уже добавленных задач
+        :param callback: Обработчик без аргументов
+        :return: Данная функция ничего не возвращает
+        """
+        self.pending.append((None, callback))
+
+    def process_next(self) -> None:
+        future, callback = self.pending.popleft()
+        if future is None:
+            callback()
+            return
+
+        self.running -= 1
+        callback(future.result())
+
+    def wait(self) -> None:
+        while self.pending:
+            self.process_next()
+
+
+class ParallelDeflateStream:
+    """
+    Сжимает поток данных по блокам в пуле и считает его контрольную сумму, сжатые блоки передаются write в исходном порядке
+    """
+    def __init__(self, pool: OrderedPool, write: Callable[[bytes], object], level: int):
+        self.pool = pool
+        self.write_compressed = write
+        self.level = level
+        self.dictionary = b""
+        self.crc = 0
+        self.size = 0
+
+    def submit(self, block: bytes, last: bool) -> None:
+        self.pool.submit(self.write_compressed, deflate_block, block, self.level, self.dictionary, last)
+        self.dictionary = block[-DICTIONARY_SIZE:]
+        self.crc = zlib.crc32(block, self.crc)
+        self.size += len(block)
+
+
+class ParallelGzipWriter:
+    """
+    Файловый объект только для записи, который сжимает данные в gzip блоками в пуле потоков.
+    Результат - обычный gzip файл с одним членом
+    """
+    def __init__(self, path: str, jobs: int, level: int = zlib.Z_DEFAULT_COMPRESSION):
+        self.file = open(path, 'wb')
+        self.file.write(GZIP_HEADER + struct.pack("<IBB", int(time.time()), 0, GZIP_OS_UNKNOWN))
+
+        self.pool = OrderedPool(jobs)
+        self.stream = ParallelDeflateStream(self.pool, self.file.write, level)
+        self.buffer = bytearray()
+
+    def __enter__(self) -> "ParallelGzipWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.pool.__exit__(*exc_info)
+            self.file.close()
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        if len(self.buffer) >= 2 * ARCHIVE_BLOCK_SIZE:  # the last block is sent on close
+            end = len(self.buffer) - ARCHIVE_BLOCK_SIZE
+            end -= end % ARCHIVE_BLOCK_SIZE
+            for start in range(0, end, ARCHIVE_BLOCK_SIZE):
+                self.stream.submit(bytes(self.buffer[start:start + ARCHIVE_BLOCK_SIZE]), last=False)
+            del self.buffer[:end]
+        return len(data)
+
+    def close(self) -> None:
+        with self.pool:
+            self.stream.submit(bytes(self.buffer), last=True)
+            self.pool.wait()
+
+        self.file.write(struct.pack("<II", self.stream.crc, self.stream.size & 0xffffffff))
+        self.file.close()
+
+
+class ParallelZipWriter:
+    """
+    Добавляет файлы в zip архив, сжимая их блоками в пуле потоков. Несколько маленьких файлов сжимаются одновременно,
+    большой файл делится на блоки. Записи пишутся в архив в порядке добавления, архив остается обычным zip
+    """
+    def __init__(self, archive: zipfile.ZipFile, jobs: int, level: int | None = None):
+        self.archive = archive
+        self.pool = OrderedPool(jobs)
+        self.level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+
+    def __enter__(self) -> "ParallelZipWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        try:
+            if exc_info[0] is None:
+                self.pool.wait()
+        finally:
+            self.pool.__exit__(*exc_info)
+
+    def write(self, path: str, arcname: str) -> None:
+        """
+        Аналог ZipFile.write, который ставит сжатие файла в очередь
+        :param path: Путь к файлу или директории
+        :param arcname: Имя в архиве
+        :return: Данная функция ничего не возвращает
+        """
+        if os.path.isdir(path):
+            self.pool.then(lambda: self.archive.write(path, arcname))
+            return
+
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.compress_size = 0
+        zinfo.CRC = 0
+        zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT  # the same estimate as in ZipFile.write
+
+        self.pool.then(lambda: self.start_member(zinfo, zip64))
+
+        def write_compressed(data: bytes) -> None:
+            fp = self.archive.fp
+            assert fp is not None
+            fp.write(data)
+            zinfo.compress_size += len(data)
+
+        stream = ParallelDeflateStream(self.pool, write_compressed, self.level)
+        with open(path, 'rb') as f:
+            block = f.read(ARCHIVE_BLOCK_SIZE)
+            while True:
+                next_block = f.read(ARCHIVE_BLOCK_SIZE)
+                stream.submit(block, last=not next_block)
+                if not next_block:
+                    break
+                block = next_block
+
+        self.pool.then(lambda: self.finish_member(zinfo, zip64, stream.crc, stream.size))
+
+    def start_member(self, zinfo: zipfile.ZipInfo, zip64: bool) -> None:
+        fp = self.archive.fp
+        assert fp is not None
+        zinfo.header_offset = fp.tell()
+        fp.write(zinfo.FileHeader(zip64))  # rewritten with the sizes and the checksum after the data
+
+    def finish_member(self, zinfo: zipfile.ZipInfo, zip64: bool, crc: int, size: int) -> None:
+        zinfo.CRC = crc
+        zinfo.file_size = size
+
+        fp = self.archive.fp
+        assert fp is not None
+        end = fp.tell()
+        fp.seek(zinfo.header_offset)
+        fp.write(zinfo.FileHeader(zip64))
+        fp.seek(end)
+
+        #  the same bookkeeping as ZipFile does after writing a member, so the central directory lists it
+        self.archive.filelist.append(zinfo)
+        self.archive.NameToInfo[zinfo.filename] = zinfo
+        self.archive.start_dir = end
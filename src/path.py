@@ -1,5 +1,12 @@
+from __future__ import annotations
+
 import os
 
+from collections.abc import Iterator
+from typing import NamedTuple
+
+from src.ignore import IgnoreMatcher
+
 
 def pretty_path(path: str) -> str:
     path = path.replace(os.path.expanduser('~'), '~', 1)
@@ -17,26 +24,113 @@ tee =    '├── '
 last =   '└── '
 
 
-def tree(path: str, prefix: str = '') -> str:
+class TreeLevel(NamedTuple):
+    entries: Iterator[tuple[int, os.DirEntry]]
+    entry_count: int
+    prefix: str
+    ignore: IgnoreMatcher | None
+    depth: int
+    ancestors: frozenset[tuple[int, int]]  # (st_dev, st_ino) of directories on the path, used to detect symlink loops
+
+
+def list_tree_entries(path: str, ignore: IgnoreMatcher | None) -> list[os.DirEntry]:
+    with os.scandir(path) as entries:
+        result = sorted(entries, key=lambda entry: entry.name)
+
+    if ignore:
+        result = [entry for entry in result if not ignore.is_ignored(entry.path, entry.is_dir())]
+
+    return result
+
+
+def count_dir_entries(path: str) -> int:
+    with os.scandir(path) as entries:
+        return sum(1 for _ in entries)
+
+
+def tree_lines(
+    path: str,
+    ignore: IgnoreMatcher | None = None,
+    max_depth: int | None = None,
+    file_limit: int | None = None,
+    follow_symlinks: bool = False,
+) -> Iterator[str]:
     """
-    Создает дерево файлво в директори
+    Обходит директорию без рекурсии и создает строки дерева файлов по одной.
+    В памяти хранятся только списки файлов директорий на текущем пути
     :param path: Путь к диркетории
-    :param prefix: Текущия индентация ветки дерева
-    :return: Возвращает дерево директории аналогично команде tree в Linux
+    :param ignore: Правила игнорирования директории. Если не заданы, выводятся все файлы
+    :param max_depth: Максимальная глубина дерева. Если не задана, дерево выводится полностью
+    :param file_limit: Директории, в которых больше файлов, не раскрываются
+    :param follow_symlinks: Раскрывать символические ссылки на директории
+    :return: Возвращает строки дерева директории аналогично команде tree в Linux
     """
-    result = '.\n' if prefix == '' else ''
+    yield '.'
 
-    files = sorted(os.listdir(path))
+    root_stat = os.stat(path)
+    entries = list_tree_entries(path, ignore)
+    stack = [TreeLevel(enumerate(entries), len(entries), '', ignore, 1, frozenset({(root_stat.st_dev, root_stat.st_ino)}))]
 
-    for i in range(len(files)):
-        file_name = files[i]
-        file_path = os.path.join(path, file_name)
+    while stack:
+        level = stack[-1]
 
-        pointer = last if i == len(files) - 1 else tee
-        result += prefix + pointer + file_name + '\n'
+        next_entry = next(level.entries, None)
+        if next_entry is None:
+            stack.pop()
+            continue
 
-        if os.path.isdir(file_path):
-            extension = branch if pointer == tee else space
-            result += tree(file_path, prefix=prefix + extension)
+        i, entry = next_entry
+        pointer = last if i == level.entry_count - 1 else tee
+        line = level.prefix + pointer + entry.name
 
-    return result
+        #  DirEntry caches the file type from scandir, no extra stat is needed
+        if not entry.is_dir() or entry.is_symlink() and not follow_symlinks \
+                or max_depth is not None and level.depth >= max_depth:
+            yield line
+            continue
+
+        ancestors = level.ancestors
+        if follow_symlinks:  # a link can point to any directory on the current path
+            entry_stat = entry.stat()
+            key = (entry_stat.st_dev, entry_stat.st_ino)
+            if key in ancestors:
+                yield line + "  [recursive, not followed]"
+                continue
+            ancestors = ancestors | {key}
+
+        try:
+            if file_limit is not None and (count := count_dir_entries(entry.path)) > file_limit:
+                yield line + f"  [{count} entries exceeds filelimit, not opening dir]"
+                continue
+
+            child_ignore = level.ignore.child(entry.path) if level.ignore else None
+            child_entries = list_tree_entries(entry.path, child_ignore)
+        except OSError:
+            yield line + "  [error opening dir]"
+            continue
+
+        yield line
+
+        extension = branch if pointer == tee else space
+        stack.append(TreeLevel(
+            enumerate(child_entries), len(child_entries), level.prefix + extension, child_ignore, level.depth + 1, ancestors
+        ))
+
+
+def tree(
+    path: str,
+    ignore: IgnoreMatcher | None = None,
+    max_depth: int | None = None,
+    file_limit: int | None = None,
+    follow_symlinks: bool = False,
+) -> str:
+    """
+    Создает дерево файлво в директори
+    :param path: Путь к диркетории
+    :param ignore: Правила игнорирования директории. Если не заданы, выводятся все файлы
+    :param max_depth: Максимальная глубина дерева. Если не задана, дерево выводится полностью
+    :param file_limit: Директории, в которых больше файлов, не раскрываются
+    :param follow_symlinks: Раскрывать символические ссылки на директории
+    :return: Возвращает дерево директории аналогично команде tree в Linux
+    """
+    return "\n".join(tree_lines(path, ignore, max_depth, file_limit, follow_symlinks)) + "\n"
@@ -2,7 +2,7 @@ import os
 import shlex
 
 from src.path import pretty_path
-from src.command import CommandEnv
+from src.command import CommandEnv, CAPTURE_FULL
 from src.constants import DEBUG
 from src.constants import COMMAND_HISTORY_PATH
 
@@ -15,8 +15,13 @@ from src.commands.plugins import shell_commands
 
 
 class Shell():
-    def __init__(self, log_filename="shell", cwd=os.getcwd()):
-        self.env = self.load_env(CommandEnv(log_filename=log_filename, cwd=cwd))
+    def __init__(self, log_filename="shell", cwd=os.getcwd(), capture=CAPTURE_FULL):
+        """
+        :param log_filename: Название лог файла
+        :param cwd: Начальная директория
+        :param capture: Сохранение вывода команд для execute: 'off', 'ring' (последние символы) или 'full'
+        """
+        self.env = self.load_env(CommandEnv(log_filename=log_filename, cwd=cwd, capture=capture))
 
     def get_prompt(self) -> str:
         return f"[{pretty_path(self.env.cwd)}] => "
@@ -40,7 +45,7 @@ class Shell():
         """
         Запускает команду
         :param cmd: Название команды и агрументы к ней
-        :return: Возвращает результат выполнения команды
+        :return: Возвращает сохраненный вывод команды
         """
         self.env.logger.info(cmd)
         with open(COMMAND_HISTORY_PATH, 'a') as f:
@@ -50,7 +55,7 @@ class Shell():
         if not cmd_args:
             return ""
 
-        self.env.command_output = ""
+        self.env.output.clear()
 
         command_function = self.env.commands.get(cmd_args[0])
         if not command_function:
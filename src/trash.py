@@ -0,0 +1,269 @@
+import os
+import time
+import uuid
+import queue
+import shutil
+import logging
+import threading
+
+from collections.abc import Callable
+from typing import NamedTuple
+
+from src.undo_journal import UndoJournal, Operation
+from src.constants import ROOT_DIR, TRASH_DIR, TRASH_ROOTS_PATH, TRASH_POLICY_PATH, MOUNT_TRASH_DIR_NAME, TRASH_PURGE_SUFFIX
+from src.constants import TRASH_MAX_BYTES, TRASH_MAX_AGE, TRASH_MAX_ENTRIES, UNDO_HISTORY_PATH
+
+
+class TrashPolicy(NamedTuple):
+    max_bytes: int = TRASH_MAX_BYTES
+    max_age: float = TRASH_MAX_AGE  # seconds
+    max_entries: int = TRASH_MAX_ENTRIES
+
+
+def read_trash_policy() -> TrashPolicy:
+    """
+    Читает ограничения корзины, заданные командой trashpolicy. Каждая строка - имя ограничения и значение через табуляцию
+    :return: Возвращает ограничения. Незаданные ограничения берутся из src/constants.py
+    """
+    if not os.path.exists(TRASH_POLICY_PATH):
+        return TrashPolicy()
+
+    with open(TRASH_POLICY_PATH, 'r') as f:
+        limits = dict(line.split('\t', 1) for line in f.read().splitlines())
+    return TrashPolicy(**{name: field_type(limits[name]) for name, field_type in TrashPolicy.__annotations__.items() if name in limits})
+
+
+def write_trash_policy(policy: TrashPolicy) -> None:
+    with open(TRASH_POLICY_PATH, 'w') as f:
+        f.writelines(f"{name}\t{value}\n" for name, value in policy._asdict().items())
+
+
+class TrashWorker:
+    """
+    Поток, который по очереди выполняет долгую работу с корзиной (удаление, подсчет размера), не блокируя оболочку
+    """
+    def __init__(self):
+        self.tasks: queue.Queue[tuple[Callable[..., None], tuple]] = queue.Queue()
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+
+    def submit(self, function: Callable[..., None], *args) -> None:
+        with self.lock:
+            if self.thread is None:
+                #  a daemon thread does not delay exit, what it did not delete is deleted on the next run
+                self.thread = threading.Thread(target=self.run, name="trash-worker", daemon=True)
+                self.thread.start()
+
+        self.tasks.put((function, args))
+
+    def run(self) -> None:
+        while True:
+            function, args = self.tasks.get()
+            try:
+                function(*args)
+            except Exception:
+                logging.getLogger(__name__).exception("Trash task failed")
+            finally:
+                self.tasks.task_done()
+
+    def wait(self) -> None:
+        self.tasks.join()
+
+
+TRASH_WORKER = TrashWorker()
+#  held by everything that changes the journal or the trash: the worker must not evict an operation which is being
+#  written or undone, nor recreate the journal while emptytrash removes it
+TRASH_LOCK = threading.Lock()
+
+
+def nearest_existing_dir(path: str) -> str:
+    path = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def find_mount_point(path: str) -> str:
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def get_registered_trash_dirs() -> list[str]:
+    if not os.path.exists(TRASH_ROOTS_PATH):
+        return []
+
+    with open(TRASH_ROOTS_PATH, 'r') as f:
+        return f.read().splitlines()
+
+
+def register_trash_dir(trash_dir: str) -> None:
+    if trash_dir not in get_registered_trash_dirs():
+        with open(TRASH_ROOTS_PATH, 'a') as f:
+            f.write(trash_dir + '\n')
+
+
+def get_mount_trash_dir(path: str) -> str | None:
+    """
+    Находит путь корзины <точка монтирования>/.Trash-<uid>/shell на файловой системе пути. Ничего не создает
+    :param path: Путь к файлу в корзине или вне ее. Сам файл может не существовать
+    :return: Возвращает путь корзины или None, если путь на файловой системе проекта и его корзина - .trash
+    """
+    parent = nearest_existing_dir(path)  # the entry is renamed inside its parent directory
+    if os.stat(parent).st_dev == os.stat(TRASH_DIR if os.path.isdir(TRASH_DIR) else ROOT_DIR).st_dev:
+        return None
+    return os.path.join(find_mount_point(parent), MOUNT_TRASH_DIR_NAME.format(uid=os.getuid()), "shell")
+
+
+def find_trash_dir(path: str) -> str:
+    """
+    Находит директорию корзины, в которую ensure_trash_dir переносил файлы с файловой системы пути. Ничего не создает
+    :param path: Путь к файлу в корзине или вне ее. Сам файл может не существовать
+    :return: Возвращает путь к директории корзины. Если корзины на файловой системе нет, возвращает .trash
+    """
+    trash_dir = get_mount_trash_dir(path)
+    return trash_dir if trash_dir is not None and os.path.isdir(trash_dir) else TRASH_DIR
+
+
+def ensure_trash_dir(path: str) -> str:
+    """
+    Выбирает директорию корзины на той же файловой системе, что и путь, чтобы файл переносился в нее через os.rename,
+    и создает ее. Для файловой системы проекта это .trash, для остальных <точка монтирования>/.Trash-<uid>/shell
+    :param path: Путь к файлу, который будет перенесен в корзину. Сам файл может не существовать
+    :return: Возвращает путь к существующей директории корзины. Если корзину на файловой системе создать нельзя, возвращает .trash
+    """
+    os.makedirs(TRASH_DIR, exist_ok=True)
+
+    trash_dir = get_mount_trash_dir(path)
+    if trash_dir is None:
+        return TRASH_DIR
+
+    try:
+        os.makedirs(trash_dir, mode=0o700, exist_ok=True)
+    except OSError:  # read-only or not writable filesystem, files are copied to .trash
+        return TRASH_DIR
+
+    register_trash_dir(trash_dir)
+    return trash_dir
+
+
+def get_operation_trash_path(operation: Operation) -> str:
+    """
+    Находит путь, под которым операция сохранила файлы в корзине
+    :param operation: Операция
+    :return: Возвращает путь в корзине. Если операция ничего не перезаписала, файла по нему нет
+    """
+    path = operation.source if operation.command == 'rm' else operation.dest
+    assert path is not None
+    return os.path.join(find_trash_dir(path), f"{operation.id}_{os.path.basename(path)}")
+
+
+def get_size(path: str) -> int:
+    """
+    Считает размер файла или директории, не переходя по символическим ссылкам
+    :param path: Путь
+    :return: Возвращает размер в байтах или 0, если пути нет
+    """
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:  # moved back by undo during the walk
+                pass
+    return size
+
+
+def move_to_purge(path: str, trash_dir: str) -> None:
+    """
+    Переносит путь в директорию удаления рядом с корзиной. Перенос мгновенный, а удаляется директория в фоне
+    :param path: Путь в корзине или сама корзина
+    :param trash_dir: Директория корзины
+    :return: Данная функция ничего не возвращает
+    """
+    purge_dir = trash_dir + TRASH_PURGE_SUFFIX
+    os.makedirs(purge_dir, exist_ok=True)
+    os.rename(path, os.path.join(purge_dir, uuid.uuid4().hex))
+
+
+def delete_purged() -> None:
+    """
+    Удаляет все перенесенное в директории удаления, в том числе оставшееся после прошлых запусков
+    :return: Данная функция ничего не возвращает
+    """
+    for trash_dir in [TRASH_DIR] + get_registered_trash_dirs():
+        purge_dir = trash_dir + TRASH_PURGE_SUFFIX
+        if not os.path.isdir(purge_dir):
+            continue
+
+        for name in os.listdir(purge_dir):  # the directory itself stays, something can be moved into it right now
+            path = os.path.join(purge_dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+
+def enforce_trash_policy(policy: TrashPolicy | None = None) -> None:
+    """
+    Считает размер новых файлов в корзине и удаляет самые старые операции вместе с их файлами в корзине,
+    пока корзина больше политики. Размер корзины хранится в журнале, поэтому корзина целиком не обходится
+    :param policy: Ограничения корзины, по умолчанию заданные командой trashpolicy
+    :return: Данная функция ничего не возвращает
+    """
+    policy = policy or read_trash_policy()
+
+    unmeasured: list[Operation] = []
+    with TRASH_LOCK:
+        if os.path.exists(UNDO_HISTORY_PATH):  # otherwise emptied in the meantime, do not create the journal again
+            with UndoJournal() as journal:
+                unmeasured = journal.unmeasured()
+
+    #  the files are walked without the lock, so a large rm does not block the next file commands
+    sizes = [(operation, get_size(get_operation_trash_path(operation))) for operation in unmeasured]
+
+    with TRASH_LOCK:
+        if os.path.exists(UNDO_HISTORY_PATH):
+            with UndoJournal() as journal:
+                #  undone operations are skipped, and so are ids reused after emptytrash recreated the journal
+                still_unmeasured = set(journal.unmeasured())
+                for operation, size in sizes:
+                    if operation in still_unmeasured:
+                        journal.set_trash_size(operation.id, size)
+
+                deadline = time.time() - policy.max_age
+                while (oldest := journal.oldest()) is not None and (
+                    journal.count() > policy.max_entries or journal.trash_size() > policy.max_bytes or oldest.created < deadline
+                ):
+                    trash_path = get_operation_trash_path(oldest)
+                    if os.path.lexists(trash_path):
+                        move_to_purge(trash_path, os.path.dirname(trash_path))
+                    journal.remove(oldest.id)
+
+    delete_purged()
+
+
+def empty_trash() -> None:
+    """
+    Очищает все корзины: .trash и корзины на других файловых системах, и удаляет журнал операций.
+    Корзины переносятся в сторону, а удаляются в фоне
+    :return: Данная функция ничего не возвращает
+    """
+    with TRASH_LOCK:
+        for trash_dir in get_registered_trash_dirs() + [TRASH_DIR]:
+            if os.path.exists(trash_dir):
+                move_to_purge(trash_dir, trash_dir)
+
+        os.makedirs(TRASH_DIR, exist_ok=True)
+
+        if os.path.exists(UNDO_HISTORY_PATH):
+            os.remove(UNDO_HISTORY_PATH)
+
+    TRASH_WORKER.submit(delete_purged)
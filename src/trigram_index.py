@@ -0,0 +1,222 @@
+import os
+import re
+import sqlite3
+import hashlib
+
+from array import array
+from collections import defaultdict
+from collections.abc import Iterable
+
+from src.constants import INDEX_DIR, INDEX_MAX_FILESIZE, INDEX_OVERLAY_MAX_FILES
+
+
+#  files.state
+NOT_INDEXED = 0  # too large or unreadable, always a candidate
+IN_POSTINGS = 1  # trigrams are stored in postings
+IN_OVERLAY = 2  # recently changed, trigrams are stored in files.trigrams until the overlay is merged into postings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    trigrams BLOB
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER PRIMARY KEY,
+    file_ids BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+TRIGRAM_REGEX = re.compile(b'...', re.DOTALL)
+
+
+def get_trigrams(data: bytes) -> set[int]:
+    """
+    Находит все триграммы в данных
+    :param data: Данные
+    :return: Возвращает множество триграмм, закодированных как 24-битные числа
+    """
+    trigrams: set[bytes] = set()
+    for offset in range(3):  # non-overlapping matches from every offset cover all trigrams
+        trigrams.update(TRIGRAM_REGEX.findall(data, offset))
+    return set(map(int.from_bytes, trigrams))
+
+
+def get_index_path(root: str) -> str:
+    return os.path.join(INDEX_DIR, hashlib.sha1(root.encode()).hexdigest() + ".sqlite")
+
+
+class TrigramIndex:
+    """
+    Индекс триграмм содержимого файлов директории, сохраненный на диске.
+    Файлы переиндексируются только если изменились их время модификации или размер
+    """
+    def __init__(self, root: str):
+        os.makedirs(INDEX_DIR, exist_ok=True)
+
+        self.root = root
+        self.connection = sqlite3.connect(get_index_path(root))
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "TrigramIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.connection.close()
+
+    def get_meta(self, key: str) -> int:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def set_meta(self, key: str, value: int) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def update(self, files: Iterable[str]) -> tuple[list[str], int, int]:
+        """
+        Обновляет индекс: индексирует новые и измененные файлы и удаляет отсутствующие
+        :param files: Пути ко всем файлам директории
+        :return: Возвращает пути к файлам, количество переиндексированных и количество удаленных файлов
+        """
+        known = {
+            path: (file_id, mtime_ns, size, state)
+            for file_id, path, mtime_ns, size, state in self.connection.execute("SELECT id, path, mtime_ns, size, state FROM files")
+        }
+
+        paths = []
+        reindexed = 0
+        changed: dict[int, array] = {}
+        postings: defaultdict[int, array] = defaultdict(lambda: array('I'))
+        stale = self.get_meta('stale')
+
+        with self.connection:
+            for path in files:
+                try:
+                    file_stat = os.stat(path)
+                except OSError:  # file disappeared during the walk
+                    continue
+
+                paths.append(path)
+
+                file_id, mtime_ns, size, state = known.pop(path, (None, None, None, None))
+                if (mtime_ns, size) == (file_stat.st_mtime_ns, file_stat.st_size):
+                    continue
+
+                if file_id is not None:
+                    self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                    stale += state == IN_POSTINGS  # its id stays in postings, but no longer matches any file
+
+                file_id, trigrams = self.add_file(path, file_stat)
+                reindexed += 1
+                if trigrams is None:
+                    continue
+
+                changed[file_id] = trigrams
+                if len(changed) > INDEX_OVERLAY_MAX_FILES:  # too many changes for the overlay, merge them into postings
+                    self.add_to_postings(postings, changed)
+
+            for file_id, _, _, state in known.values():
+                self.connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+                stale += state == IN_POSTINGS
+
+            overlay_count = self.connection.execute("SELECT COUNT(*) FROM files WHERE state = ?", (IN_OVERLAY,)).fetchone()[0]
+            if postings or overlay_count + len(changed) > INDEX_OVERLAY_MAX_FILES:
+                self.add_to_postings(postings, changed)
+                self.merge_overlay(postings)
+            else:
+                self.connection.executemany(
+                    "UPDATE files SET trigrams = ? WHERE id = ?",
+                    ((trigrams.tobytes(), file_id) for file_id, trigrams in changed.items())
+                )
+
+            self.set_meta('stale', stale)
+
+        if stale > INDEX_OVERLAY_MAX_FILES and stale > len(paths):  # postings are mostly dead ids, rebuild from scratch
+            self.clear()
+            paths, reindexed, _ = self.update(paths)
+
+        return paths, reindexed, len(known)
+
+    def add_file(self, path: str, file_stat: os.stat_result) -> tuple[int, array | None]:
+        trigrams: array | None = None
+        if file_stat.st_size <= INDEX_MAX_FILESIZE:
+            try:
+                with open(path, 'rb') as f:
+                    trigrams = array('I', get_trigrams(f.read()))
+            except OSError:  # unreadable files are never narrowed down by the index
+                pass
+
+        cursor = self.connection.execute(
+            "INSERT INTO files (path, mtime_ns, size, state) VALUES (?, ?, ?, ?)",
+            (path, file_stat.st_mtime_ns, file_stat.st_size, NOT_INDEXED if trigrams is None else IN_OVERLAY)
+        )
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid, trigrams
+
+    @staticmethod
+    def add_to_postings(postings: defaultdict[int, array], changed: dict[int, array]) -> None:
+        for file_id, trigrams in changed.items():
+            for trigram in trigrams:
+                postings[trigram].append(file_id)
+        changed.clear()
+
+    def merge_overlay(self, postings: defaultdict[int, array]) -> None:
+        """
+        Добавляет новые файлы и файлы из оверлея в postings. Каждая запись postings перезаписывается один раз
+        :param postings: Новые id файлов для каждой триграммы
+        :return: Данная функция ничего не возвращает
+        """
+        overlay = self.connection.execute(
+            "SELECT id, trigrams FROM files WHERE state = ? AND trigrams IS NOT NULL", (IN_OVERLAY,)
+        ).fetchall()
+        for file_id, blob in overlay:
+            for trigram in array('I', blob):
+                postings[trigram].append(file_id)
+
+        for trigram, file_ids in postings.items():
+            row = self.connection.execute("SELECT file_ids FROM postings WHERE trigram = ?", (trigram,)).fetchone()
+            blob = (row[0] if row else b"") + file_ids.tobytes()
+            self.connection.execute("INSERT OR REPLACE INTO postings (trigram, file_ids) VALUES (?, ?)", (trigram, blob))
+
+        self.connection.execute("UPDATE files SET state = ?, trigrams = NULL WHERE state = ?", (IN_POSTINGS, IN_OVERLAY))
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute("DELETE FROM files")
+            self.connection.execute("DELETE FROM postings")
+            self.connection.execute("DELETE FROM meta")
+
+    def candidates(self, literals: Iterable[bytes]) -> set[str] | None:
+        """
+        Находит файлы, которые могут содержать все строки
+        :param literals: Строки, которые обязательно присутствуют в каждом совпадении
+        :return: Возвращает пути к файлам или None, если по строкам нельзя сузить поиск
+        """
+        query = set().union(*(get_trigrams(literal) for literal in literals))
+        if not query:
+            return None
+
+        file_ids: set[int] | None = None
+        for trigram in query:
+            row = self.connection.execute("SELECT file_ids FROM postings WHERE trigram = ?", (trigram,)).fetchone()
+            posting = set(array('I', row[0])) if row else set()
+            file_ids = posting if file_ids is None else file_ids & posting
+            if not file_ids:
+                break
+
+        file_ids = file_ids or set()
+
+        paths = set()
+        for file_id, path, state, blob in self.connection.execute("SELECT id, path, state, trigrams FROM files"):
+            if state == NOT_INDEXED or state == IN_POSTINGS and file_id in file_ids:
+                paths.add(path)
+            elif state == IN_OVERLAY and query.issubset(array('I', blob)):
+                paths.add(path)
+
+        return paths
@@ -0,0 +1,225 @@
+import os
+import time
+import shlex
+import sqlite3
+
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+from src.constants import UNDO_HISTORY_PATH
+
+
+#  operations.state
+PENDING = 0  # the command is running, its id is already used in trash names
+DONE = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    source TEXT,
+    dest TEXT,
+    state INTEGER NOT NULL,
+    created REAL NOT NULL DEFAULT 0,
+    trash_size INTEGER  -- bytes the operation put into trash, NULL until measured
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    operation_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (operation_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+#  columns added after the first version of the journal
+ADDED_COLUMNS = {
+    'created': "REAL NOT NULL DEFAULT 0",
+    'trash_size': "INTEGER",
+}
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+class Operation(NamedTuple):
+    id: int
+    command: str
+    source: str | None
+    dest: str | None
+    created: float
+
+
+def is_text_history(path: str) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) != SQLITE_HEADER
+
+
+class UndoJournal:
+    """
+    Журнал операций для undo в SQLite. Номер операции выдается при ее начале и используется в именах файлов в корзине,
+    списки файлов операций хранятся отдельно от самих операций
+    """
+    def __init__(self, path: str = UNDO_HISTORY_PATH):
+        old_lines = None
+        if is_text_history(path):  # history written one shlex line per command by older versions
+            with open(path, 'r') as f:
+                old_lines = f.read().splitlines()
+            os.remove(path)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.add_missing_columns()
+        self.pending: set[int] = set()
+
+        if old_lines is not None:
+            self.import_text_history(old_lines)
+
+    def __enter__(self) -> "UndoJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.pending:  # the command failed before it was recorded
+            self.remove(*self.pending)
+        self.connection.close()
+
+    def add_missing_columns(self) -> None:
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(operations)")}
+        with self.connection:
+            for column, definition in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE operations ADD COLUMN {column} {definition}")
+
+            if 'created' not in columns:  # age of older operations is counted from now
+                self.connection.execute("UPDATE operations SET created = ?", (time.time(),))
+
+    def import_text_history(self, lines: list[str]) -> None:
+        for line in lines:  # ids are given in the same order, so trash names made from line numbers still match
+            args = shlex.split(line)
+            command = args.pop(0)
+
+            source = args.pop(0) if command in ('mv', 'rm') else None
+            dest = args.pop(0) if command in ('cp', 'mv') else None
+
+            operation_id = self.begin(command)
+            self.commit(operation_id, source=source, dest=dest, paths=args)
+
+    def begin(self, command: str) -> int:
+        """
+        Начинает операцию
+        :param command: Название команды
+        :return: Возвращает номер операции. Номера не повторяются, даже после отмены операций
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO operations (command, state, created) VALUES (?, ?, ?)", (command, PENDING, time.time())
+            )
+
+        assert cursor.lastrowid is not None
+        self.pending.add(cursor.lastrowid)
+        return cursor.lastrowid
+
+    def commit(self, operation_id: int, source: str | None = None, dest: str | None = None, paths: Iterable[str] = ()) -> None:
+        """
+        Записывает завершенную операцию
+        :param operation_id: Номер операции
+        :param source: Исходный путь операции
+        :param dest: Конечный путь операции
+        :param paths: Пути к файлам, нужные для отмены операции
+        :return: Данная функция ничего не возвращает
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO manifest (operation_id, position, path) VALUES (?, ?, ?)",
+                ((operation_id, position, path) for position, path in enumerate(paths))
+            )
+            self.connection.execute(
+                "UPDATE operations SET source = ?, dest = ?, state = ? WHERE id = ?", (source, dest, DONE, operation_id)
+            )
+
+        self.pending.discard(operation_id)
+
+    def last(self) -> Operation | None:
+        row = self.connection.execute(
+            "SELECT id, command, source, dest, created FROM operations WHERE state = ? ORDER BY id DESC LIMIT 1", (DONE,)
+        ).fetchone()
+        return Operation(*row) if row else None
+
+    def operations(self, limit: int | None = None, to_id: int | None = None) -> list[Operation]:
+        """
+        Находит завершенные операции, начиная с последней
+        :param limit: Максимальное количество операций
+        :param to_id: Номер самой ранней операции
+        :return: Возвращает операции в порядке от последней к ранней
+        """
+        rows = self.connection.execute(
+            "SELECT id, command, source, dest, created FROM operations WHERE state = ? AND id >= ? ORDER BY id DESC LIMIT ?",
+            (DONE, to_id or 0, -1 if limit is None else limit)
+        )
+        return [Operation(*row) for row in rows]
+
+    def oldest(self) -> Operation | None:
+        row = self.connection.execute(
+            "SELECT id, command, source, dest, created FROM operations WHERE state = ? ORDER BY id LIMIT 1", (DONE,)
+        ).fetchone()
+        return Operation(*row) if row else None
+
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM operations WHERE state = ?", (DONE,)).fetchone()[0]
+
+    def unmeasured(self) -> list[Operation]:
+        rows = self.connection.execute(
+            "SELECT id, command, source, dest, created FROM operations WHERE state = ? AND trash_size IS NULL ORDER BY id", (DONE,)
+        )
+        return [Operation(*row) for row in rows]
+
+    def set_trash_size(self, operation_id: int, size: int) -> None:
+        """
+        Записывает размер файлов операции в корзине и добавляет его к общему размеру корзины
+        :param operation_id: Номер операции
+        :param size: Размер в байтах
+        :return: Данная функция ничего не возвращает
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE operations SET trash_size = ? WHERE id = ? AND trash_size IS NULL", (size, operation_id)
+            )
+            if cursor.rowcount:  # the operation could have been undone in the meantime
+                self.connection.execute(
+                    "INSERT INTO meta (key, value) VALUES ('trash_size', ?) ON CONFLICT (key) DO UPDATE SET value = value + ?",
+                    (size, size)
+                )
+
+    def trash_size(self) -> int:
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'trash_size'").fetchone()
+        return row[0] if row else 0
+
+    def count_paths(self, operation_id: int) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM manifest WHERE operation_id = ?", (operation_id,)).fetchone()[0]
+
+    def paths(self, operation_id: int) -> Iterator[str]:
+        cursor = self.connection.execute("SELECT path FROM manifest WHERE operation_id = ? ORDER BY position", (operation_id,))
+        for (path,) in cursor:
+            yield path
+
+    def has_paths(self, operation_id: int) -> bool:
+        return self.connection.execute("SELECT 1 FROM manifest WHERE operation_id = ? LIMIT 1", (operation_id,)).fetchone() is not None
+
+    def remove(self, *operation_ids: int) -> None:
+        """
+        Удаляет операции из журнала одной транзакцией
+        :param operation_ids: Номера операций
+        :return: Данная функция ничего не возвращает
+        """
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE meta SET value = value - COALESCE((SELECT trash_size FROM operations WHERE id = ?), 0) WHERE key = 'trash_size'",
+                ((i,) for i in operation_ids)
+            )
+            self.connection.executemany("DELETE FROM manifest WHERE operation_id = ?", ((i,) for i in operation_ids))
+            self.connection.executemany("DELETE FROM operations WHERE id = ?", ((i,) for i in operation_ids))
@@ -1,13 +1,20 @@
 import pytest
 
 import os
+import logging
+import shutil
+import tarfile
+import zipfile
 from shutil import ReadError
 
 from tests.setup import sandbox_shell
 from tests.setup import clear_or_create_test_sandbox
 from tests.setup import create_file, create_dir
 
-from src.constants import TEST_SANDBOX_DIR
+from src.path import tree
+from src.commands.plugins import archive as archive_plugin
+from src.commands.plugins.archive import ARCHIVE_FORMATS
+from src.constants import TEST_SANDBOX_DIR, ARCHIVE_BLOCK_SIZE
 
 
 @pytest.mark.usefixtures("clear_or_create_test_sandbox")
@@ -58,6 +65,9 @@ def test_tar_and_untar(sandbox_shell):
     subdir = create_dir(os.path.join(dir, 'subdir'))
     create_file(os.path.join(subdir, 'file1'), "file1_subdir\n")
     create_file(os.path.join(subdir, 'file2'), "file2_subdir\n")
+    inner = create_dir(os.path.join(subdir, 'inner'))
+    create_file(os.path.join(inner, 'file3'), "file3_inner\n")
+    os.utime(inner, (1_000_000_000, 1_000_000_000))
 
     subdir_archive = os.path.join(TEST_SANDBOX_DIR, 'subdir.tar')
 
@@ -86,3 +96,218 @@ def test_tar_and_untar(sandbox_shell):
         assert f.read() == "file1_subdir\n"
     with open(file2_extracted, 'r') as f:
         assert f.read() == "file2_subdir\n"
+
+    # the mtime of a directory is restored after its contents are extracted
+    assert os.stat(os.path.join(TEST_SANDBOX_DIR, 'inner')).st_mtime == 1_000_000_000
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_archive_gitignore(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, '.gitignore'), ".venv\n")
+    create_file(os.path.join(dir, 'file1'), "file1_dir\n")
+    venv = create_dir(os.path.join(dir, '.venv'))
+    create_file(os.path.join(venv, 'file1'), "file1_venv\n")
+
+    for format in ('zip', 'tar'):
+        sandbox_shell.execute(f"{format} dir dir_all")
+        sandbox_shell.execute(f"{format} dir dir_ignored --gitignore")
+
+    with zipfile.ZipFile(os.path.join(TEST_SANDBOX_DIR, 'dir_all.zip')) as archive:
+        assert '.venv/file1' in archive.namelist()
+    with zipfile.ZipFile(os.path.join(TEST_SANDBOX_DIR, 'dir_ignored.zip')) as archive:
+        assert 'file1' in archive.namelist() and '.venv/file1' not in archive.namelist()
+
+    with tarfile.open(os.path.join(TEST_SANDBOX_DIR, 'dir_all.tar')) as archive:
+        assert '.venv/file1' in archive.getnames()
+    with tarfile.open(os.path.join(TEST_SANDBOX_DIR, 'dir_ignored.tar')) as archive:
+        assert 'file1' in archive.getnames() and '.venv/file1' not in archive.getnames()
+
+
+@pytest.mark.parametrize('format', sorted(ARCHIVE_FORMATS))
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_archive_formats(sandbox_shell, format):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file1'), "file1_dir\n" * 1000)
+    create_file(os.path.join(create_dir(os.path.join(dir, 'subdir')), 'file2'), "file2_subdir\n")
+    extension = ARCHIVE_FORMATS[format].extension
+
+    sandbox_shell.execute(f"{format} dir")
+    archive = os.path.join(TEST_SANDBOX_DIR, f'dir.{extension}')
+    assert os.path.exists(archive)
+
+    levels = ARCHIVE_FORMATS[format].levels
+    if levels is not None:
+        sandbox_shell.execute(f"{format} dir fast --level {levels[0]}")
+        sandbox_shell.execute(f"{format} dir best --level {levels[-1]}")
+        assert os.path.getsize(os.path.join(TEST_SANDBOX_DIR, f'best.{extension}')) <= os.path.getsize(
+            os.path.join(TEST_SANDBOX_DIR, f'fast.{extension}')
+        )
+        with pytest.raises(ValueError):
+            sandbox_shell.execute(f"{format} dir wrong --level {levels[-1] + 1}")
+    else:
+        with pytest.raises(ValueError):
+            sandbox_shell.execute(f"{format} dir wrong --level 1")
+
+    extracted = create_dir(os.path.join(TEST_SANDBOX_DIR, 'extracted'))
+    sandbox_shell.execute("cd extracted")
+    sandbox_shell.execute(f"un{format} ../dir.{extension}")
+    with open(os.path.join(extracted, 'subdir', 'file2')) as f:
+        assert f.read() == "file2_subdir\n"
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_archive_store(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file1'), "file1_dir\n" * 1000)
+
+    sandbox_shell.execute("zip dir stored --store")
+    with zipfile.ZipFile(os.path.join(TEST_SANDBOX_DIR, 'stored.zip')) as archive:
+        assert archive.getinfo('file1').compress_type == zipfile.ZIP_STORED
+
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("gztar dir stored --store")
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("zip dir stored_level --store --level 9")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_archive_parallel(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    large = "".join(f"line {i}\n" for i in range(ARCHIVE_BLOCK_SIZE // 4))  # split into several blocks
+    create_file(os.path.join(dir, 'large'), large)
+    create_file(os.path.join(dir, 'empty'), "")
+    for i in range(20):
+        create_file(os.path.join(create_dir(os.path.join(dir, f'subdir{i}')), 'file'), f"file_subdir{i}\n")
+
+    sandbox_shell.execute("zip dir parallel -j 4")
+    sandbox_shell.execute("zip dir serial -j 1")
+    with zipfile.ZipFile(os.path.join(TEST_SANDBOX_DIR, 'parallel.zip')) as parallel:
+        with zipfile.ZipFile(os.path.join(TEST_SANDBOX_DIR, 'serial.zip')) as serial:
+            assert parallel.testzip() is None
+            assert parallel.namelist() == serial.namelist()
+            assert parallel.read('large').decode() == large and parallel.read('empty') == b""
+
+    sandbox_shell.execute("gztar dir parallel -j 4 --level 1")
+    with tarfile.open(os.path.join(TEST_SANDBOX_DIR, 'parallel.tar.gz')) as archive:
+        assert archive.extractfile('large').read().decode() == large
+        assert archive.extractfile('subdir19/file').read() == b"file_subdir19\n"
+
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("xztar dir parallel -j 4")
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("zip dir zero -j 0")
+
+
+@pytest.mark.parametrize('format', ['zip', 'gztar'])
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_selective_extraction(sandbox_shell, format):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'config.yml'), "config\n")
+    create_file(os.path.join(dir, 'data.txt'), "data\n")
+    subdir = create_dir(os.path.join(dir, 'subdir'))
+    create_file(os.path.join(subdir, 'file1.txt'), "file1_subdir\n")
+    create_file(os.path.join(subdir, 'file2.yml'), "file2_subdir\n")
+
+    sandbox_shell.execute(f"{format} dir")
+    archive = f"dir.{ARCHIVE_FORMATS[format].extension}"
+
+    listing = sandbox_shell.execute(f"un{format} {archive} --list").splitlines()
+    assert [line.split()[-1] for line in listing] == ['subdir/', 'config.yml', 'data.txt', 'subdir/file1.txt', 'subdir/file2.yml']
+    assert listing[1].split()[0] == str(len("config\n"))
+
+    listing = sandbox_shell.execute(f"un{format} {archive} --list '*.yml'").splitlines()
+    assert [line.split()[-1] for line in listing] == ['config.yml', 'subdir/file2.yml']
+
+    # only the selected files are extracted into the -C directory
+    extracted = create_dir(os.path.join(TEST_SANDBOX_DIR, 'extracted'))
+    sandbox_shell.execute(f"un{format} {archive} -C extracted config.yml subdir")
+    assert sorted(os.listdir(extracted)) == ['config.yml', 'subdir']
+    assert sorted(os.listdir(os.path.join(extracted, 'subdir'))) == ['file1.txt', 'file2.yml']
+    assert not os.path.exists(os.path.join(TEST_SANDBOX_DIR, 'config.yml'))
+
+    with pytest.raises(FileNotFoundError):
+        sandbox_shell.execute(f"un{format} {archive} -C extracted missing.txt")
+    with pytest.raises(NotADirectoryError):
+        sandbox_shell.execute(f"un{format} {archive} -C missing_dir")
+
+
+@pytest.mark.parametrize('format', ['zip', 'tar'])
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_incremental_archives(sandbox_shell, format):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    changed = create_file(os.path.join(dir, 'changed'), "changed\n")
+    touched = create_file(os.path.join(dir, 'touched'), "touched\n")
+    subdir = create_dir(os.path.join(dir, 'subdir'))
+    create_file(os.path.join(subdir, 'deleted'), "deleted\n")
+    extension = ARCHIVE_FORMATS[format].extension
+
+    sandbox_shell.execute(f"{format} dir --incremental")
+    assert os.path.exists(os.path.join(TEST_SANDBOX_DIR, f'dir.{extension}.manifest'))
+
+    create_file(changed, "changed again\n")
+    os.utime(touched, ns=(0, 0))  # the contents are the same, only the time changed
+    os.remove(os.path.join(subdir, 'deleted'))
+    create_file(os.path.join(dir, 'new'), "new\n")
+
+    sandbox_shell.execute(f"{format} dir --incremental")
+    delta = f'dir.1.{extension}'
+    listing = sandbox_shell.execute(f"un{format} {delta} --list").splitlines()
+    assert [line.split()[-1] for line in listing] == ['changed', 'new']
+
+    # a file replaced with a directory is deleted before the directory is extracted
+    os.remove(touched)
+    create_file(os.path.join(create_dir(touched), 'file'), "file_touched\n")
+    shutil.rmtree(subdir)
+    sandbox_shell.execute(f"{format} dir --incremental")
+
+    extracted = create_dir(os.path.join(TEST_SANDBOX_DIR, 'extracted'))
+    sandbox_shell.execute(f"un{format} dir.{extension} --chain -C extracted")
+    assert tree(extracted) == tree(dir)
+    with open(os.path.join(extracted, 'changed')) as f:
+        assert f.read() == "changed again\n"
+
+    # without changes the delta is empty
+    sandbox_shell.execute(f"{format} dir --incremental")
+    assert sandbox_shell.execute(f"un{format} dir.3.{extension} --list") == ""
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_incremental_archive_inside_directory(sandbox_shell, monkeypatch):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'a.py'), "a\n")
+    create_file(os.path.join(dir, 'notes.md'), "notes\n")
+    create_file(os.path.join(dir, 'notes.txt'), "notes\n")
+
+    # only the archives and the manifest are left out, not the files named like them
+    sandbox_shell.execute("zip dir dir/notes --incremental")
+    listing = sandbox_shell.execute("unzip dir/notes.zip --list").splitlines()
+    assert [line.split()[-1] for line in listing] == ['a.py', 'notes.md', 'notes.txt']
+
+    sandbox_shell.execute("zip dir dir/notes --incremental")
+    assert sandbox_shell.execute("unzip dir/notes.1.zip --list") == ""
+
+    # a failed delta is removed, so it does not break the chain
+    def write_partial_archive(dest_path, *args, **kwargs):
+        create_file(dest_path, "partial")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(archive_plugin, 'write_archive', write_partial_archive)
+    with pytest.raises(OSError):
+        sandbox_shell.execute("zip dir dir/notes --incremental")
+    assert not os.path.exists(os.path.join(dir, 'notes.2.zip'))
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_extraction_progress(sandbox_shell, caplog):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    for name in ('file1', 'file2'):
+        with open(os.path.join(dir, name), 'wb') as f:
+            f.write(os.urandom(1024 ** 2))
+
+    # only the bytes of the extracted members are counted, not the central directory read first
+    sandbox_shell.execute("zip dir --store")
+    create_dir(os.path.join(TEST_SANDBOX_DIR, 'extracted'))
+    with caplog.at_level(logging.INFO):
+        sandbox_shell.execute("unzip dir.zip -C extracted file1")
+    assert "1.0/2.0 MiB" in caplog.records[-1].getMessage()
@@ -1,14 +1,22 @@
 import pytest
 
 import os
+import errno
+import shutil
+import tempfile
+import threading
 
 from tests.setup import sandbox_shell
 from tests.setup import clear_or_create_test_sandbox, clear_undo_history
 from tests.setup import create_file, create_dir
 
+from src import fastcopy
 from src.path import tree
-from src.constants import TEST_SANDBOX_DIR
-from src.constants import TRASH_DIR, UNDO_HISTORY_PATH
+from src.trash import get_mount_trash_dir, find_trash_dir, get_registered_trash_dirs, enforce_trash_policy, TrashPolicy
+from src.trash import TRASH_WORKER, TRASH_LOCK, get_size, read_trash_policy
+from src.undo_journal import UndoJournal
+from src.constants import ROOT_DIR, TEST_SANDBOX_DIR, TRASH_ROOTS_PATH, TRASH_POLICY_PATH
+from src.constants import TRASH_DIR, TRASH_PURGE_SUFFIX, UNDO_HISTORY_PATH
 
 
 @pytest.mark.usefixtures("clear_or_create_test_sandbox")
@@ -242,3 +250,387 @@ def test_emptytrash(sandbox_shell):
     sandbox_shell.execute("emptytrash")
     assert not os.listdir(TRASH_DIR)
     assert not os.path.exists(UNDO_HISTORY_PATH)
+
+
+@pytest.mark.parametrize("unsupported", [(), ("clone",), ("clone", "copy_file_range"), ("clone", "copy_file_range", "sendfile")])
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_fastcopy(monkeypatch, unsupported):
+    def not_supported(*args):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    if "clone" in unsupported:
+        monkeypatch.setattr(fastcopy, 'clone_file', lambda src_fd, dst_fd: False)
+    if "copy_file_range" in unsupported:
+        monkeypatch.setattr(fastcopy, 'copy_file_range', not_supported)
+    if "sendfile" in unsupported:
+        monkeypatch.setattr(fastcopy, 'sendfile', not_supported)
+
+    contents = os.urandom(3 * 1024 ** 2 + 17)
+    file1 = os.path.join(TEST_SANDBOX_DIR, 'file1')
+    with open(file1, 'wb') as f:
+        f.write(contents)
+    os.chmod(file1, 0o640)
+
+    file2 = fastcopy.copy2(file1, os.path.join(TEST_SANDBOX_DIR, 'file2'))
+    with open(file2, 'rb') as f:
+        assert f.read() == contents
+    assert os.stat(file2).st_mode == os.stat(file1).st_mode
+
+    # copying into a directory and overwriting
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file1'), "old\n")
+    assert fastcopy.copy2(file1, dir) == os.path.join(dir, 'file1')
+    assert os.path.getsize(os.path.join(dir, 'file1')) == len(contents)
+
+    # empty files and symbolic links
+    empty = create_file(os.path.join(TEST_SANDBOX_DIR, 'empty'))
+    assert os.path.getsize(fastcopy.copy2(empty, os.path.join(TEST_SANDBOX_DIR, 'empty2'))) == 0
+
+    link = os.path.join(TEST_SANDBOX_DIR, 'link')
+    os.symlink('file1', link)
+    link2 = fastcopy.copy2(link, os.path.join(TEST_SANDBOX_DIR, 'link2'), follow_symlinks=False)
+    assert os.readlink(link2) == 'file1'
+
+    with pytest.raises(shutil.SameFileError):
+        fastcopy.copyfile(file1, file1)
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_fastcopy_short(monkeypatch):
+    # some filesystems end copy_file_range and sendfile early, then the file is copied again with shutil
+    def short_copy(copy_function):
+        def copy(src_fd, dst_fd, count):
+            return copy_function(src_fd, dst_fd, 1024) if os.lseek(src_fd, 0, os.SEEK_CUR) == 0 else 0
+        return copy
+
+    monkeypatch.setattr(fastcopy, 'clone_file', lambda src_fd, dst_fd: False)
+    monkeypatch.setattr(fastcopy, 'copy_file_range', short_copy(fastcopy.copy_file_range))
+    monkeypatch.setattr(fastcopy, 'sendfile', short_copy(fastcopy.sendfile))
+
+    contents = os.urandom(1024 ** 2)
+    file1 = os.path.join(TEST_SANDBOX_DIR, 'file1')
+    with open(file1, 'wb') as f:
+        f.write(contents)
+
+    file2 = fastcopy.copy2(file1, os.path.join(TEST_SANDBOX_DIR, 'file2'))
+    with open(file2, 'rb') as f:
+        assert f.read() == contents
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_cp_parallel(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    for i in range(10):
+        subdir = create_dir(os.path.join(dir, f'subdir{i}'))
+        for j in range(20):
+            create_file(os.path.join(subdir, f'file{j}'), f"file{j}_subdir{i}\n")
+
+    # the same result and undo history with any number of jobs
+    sandbox_shell.execute("cp -r -j 1 dir dir_copy1")
+    sandbox_shell.execute("cp -r -j 8 dir dir_copy8")
+    assert tree(dir) == tree(os.path.join(TEST_SANDBOX_DIR, 'dir_copy1')) == tree(os.path.join(TEST_SANDBOX_DIR, 'dir_copy8'))
+
+    # overwritten files are trashed and listed in sorted order
+    other = create_dir(os.path.join(TEST_SANDBOX_DIR, 'other'))
+    sandbox_shell.execute("cp -r dir other")
+    create_file(os.path.join(other, 'dir', 'subdir0', 'file0'), "changed\n")
+
+    sandbox_shell.execute("mv -j 8 other/dir .")
+    with open(os.path.join(dir, 'subdir0', 'file0')) as f:
+        assert f.read() == "changed\n"
+
+    with UndoJournal() as journal:
+        operation = journal.last()
+        moved = list(journal.paths(operation.id))
+    assert moved == sorted(moved, key=lambda path: path.split(os.sep))
+    assert len(moved) == 200
+
+    sandbox_shell.execute("undo")
+    with open(os.path.join(other, 'dir', 'subdir0', 'file0')) as f:
+        assert f.read() == "changed\n"
+    with open(os.path.join(dir, 'subdir0', 'file0')) as f:
+        assert f.read() == "file0_subdir0\n"
+
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("cp -r -j 0 dir dir_copy0")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_overwritten_files_renamed_to_trash(sandbox_shell):
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
+    file2 = create_file(os.path.join(TEST_SANDBOX_DIR, 'file2'), "file2\n")
+    file2_inode = os.stat(file2).st_ino
+
+    sandbox_shell.execute("cp file1 file2")
+
+    # the overwritten file itself is moved to trash, not copied
+    trashed = os.path.join(TRASH_DIR, '1_file2')
+    assert os.stat(trashed).st_ino == file2_inode
+    with open(file2) as f:
+        assert f.read() == "file1\n"
+
+    sandbox_shell.execute("undo")
+    with open(file2) as f:
+        assert f.read() == "file2\n"
+
+
+OTHER_FILESYSTEM_DIR = '/dev/shm'
+
+
+@pytest.mark.skipif(
+    not os.access(OTHER_FILESYSTEM_DIR, os.W_OK) or os.stat(OTHER_FILESYSTEM_DIR).st_dev == os.stat(ROOT_DIR).st_dev,
+    reason="needs a writable directory on another filesystem"
+)
+@pytest.mark.usefixtures("clear_undo_history")
+def test_trash_on_other_filesystem(sandbox_shell):
+    dir = tempfile.mkdtemp(dir=OTHER_FILESYSTEM_DIR)
+    trash_dir = get_mount_trash_dir(dir)
+    assert trash_dir is not None
+    mount_trash_dir = os.path.dirname(trash_dir)
+    existed = {path: os.path.exists(path) for path in (mount_trash_dir, trash_dir, trash_dir + TRASH_PURGE_SUFFIX)}
+    registered = trash_dir in get_registered_trash_dirs()
+    try:
+        subdir = create_dir(os.path.join(dir, 'subdir'))
+        file1 = create_file(os.path.join(subdir, 'file1'), "file1\n")
+        file1_inode = os.stat(file1).st_ino
+
+        # the lookup does not create the trash
+        if not existed[trash_dir]:
+            assert find_trash_dir(subdir) == TRASH_DIR and not os.path.exists(trash_dir)
+
+        sandbox_shell.execute(f"rm -r -f {subdir}")
+        assert os.stat(trash_dir).st_dev == os.stat(dir).st_dev
+        assert find_trash_dir(subdir) == trash_dir
+        assert os.stat(os.path.join(trash_dir, '1_subdir', 'file1')).st_ino == file1_inode
+        sandbox_shell.execute("undo")
+        assert os.stat(file1).st_ino == file1_inode
+        sandbox_shell.execute(f"rm {file1}")
+        sandbox_shell.execute("emptytrash")
+        assert not os.path.exists(trash_dir)
+    finally:
+        TRASH_WORKER.wait()
+        shutil.rmtree(dir)
+        for path, path_existed in existed.items():
+            if not path_existed:
+                shutil.rmtree(path, ignore_errors=True)
+        if not registered:
+            with open(TRASH_ROOTS_PATH, 'w') as f:
+                f.writelines(line + '\n' for line in get_registered_trash_dirs() if line != trash_dir)
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_undo_journal(sandbox_shell):
+    file1 = create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
+
+    with UndoJournal() as journal:
+        operation_id = journal.begin('cp')
+        journal.commit(operation_id, dest=file1, paths=[f"path{i}" for i in range(1000)])
+
+        assert journal.last()[:4] == (operation_id, 'cp', None, file1)
+        assert list(journal.paths(operation_id)) == [f"path{i}" for i in range(1000)]
+
+        # unfinished operations are not undone
+        journal.begin('rm')
+        assert journal.last().id == operation_id
+
+        journal.remove(operation_id)
+        assert journal.last() is None
+
+    # numbers are not reused, so trash names stay unique
+    with UndoJournal() as journal:
+        assert journal.begin('rm') > operation_id + 1
+
+    # failed commands are not recorded
+    with pytest.raises(FileNotFoundError):
+        sandbox_shell.execute("cp file1 missing_dir/file1")
+    with UndoJournal() as journal:
+        assert journal.last() is None
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_undo_text_history(sandbox_shell):
+    file1 = create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
+    file2 = os.path.join(TEST_SANDBOX_DIR, 'file2')
+
+    # history written by older versions is imported
+    with open(UNDO_HISTORY_PATH, 'w') as f:
+        f.write(f"rm {file2}\n")
+        f.write(f"mv {file1} {file2}\n")
+    os.rename(file1, file2)
+
+    sandbox_shell.execute("undo")
+    assert os.path.exists(file1) and not os.path.exists(file2)
+
+    with UndoJournal() as journal:
+        assert journal.last()[:4] == (1, 'rm', file2, None)
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_undo_batch(sandbox_shell):
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
+
+    sandbox_shell.execute("cp file1 file2")
+    sandbox_shell.execute("mv file2 file3")
+    sandbox_shell.execute("cp file3 file4")
+    sandbox_shell.execute("rm file4")
+    sandbox_shell.execute("cp file1 file5")
+
+    result = sandbox_shell.execute("undo --list")
+    assert result.splitlines()[0].startswith("5 cp") and result.splitlines()[-1].startswith("1 cp")
+
+    sandbox_shell.execute("undo 2")
+    assert sorted(os.listdir(TEST_SANDBOX_DIR)) == ['file1', 'file3', 'file4']
+
+    sandbox_shell.execute("undo --to 2")
+    assert sorted(os.listdir(TEST_SANDBOX_DIR)) == ['file1', 'file2']
+
+    sandbox_shell.execute("undo 10")
+    assert os.listdir(TEST_SANDBOX_DIR) == ['file1']
+    assert sandbox_shell.execute("undo") == "No more commands to undo!\n"
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_trash_policy(sandbox_shell):
+    for i in range(4):
+        create_file(os.path.join(TEST_SANDBOX_DIR, f'file{i}'), "1" * 100 * (i + 1))
+        sandbox_shell.execute(f"rm file{i}")
+    TRASH_WORKER.wait()
+
+    # sizes of trashed files are counted once, when they are trashed
+    with UndoJournal() as journal:
+        assert journal.trash_size() == 100 + 200 + 300 + 400
+        first_id = journal.oldest().id
+
+    enforce_trash_policy(TrashPolicy(max_entries=3))
+    with UndoJournal() as journal:
+        assert journal.count() == 3 and journal.trash_size() == 900
+    assert not os.path.exists(os.path.join(TRASH_DIR, f'{first_id}_file0'))
+
+    enforce_trash_policy(TrashPolicy(max_bytes=500))
+    with UndoJournal() as journal:
+        assert journal.count() == 1 and journal.trash_size() == 400
+
+    sandbox_shell.execute("undo")
+    with UndoJournal() as journal:
+        assert journal.trash_size() == 0
+    assert os.path.exists(os.path.join(TEST_SANDBOX_DIR, 'file3'))
+
+    # the trash is moved aside at once and deleted in background
+    sandbox_shell.execute("rm file3")
+    sandbox_shell.execute("emptytrash")
+    assert not os.listdir(TRASH_DIR)
+
+    TRASH_WORKER.wait()
+    assert not os.listdir(TRASH_DIR + TRASH_PURGE_SUFFIX)
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_trashpolicy(sandbox_shell):
+    try:
+        assert "max entries: 1000" in sandbox_shell.execute("trashpolicy")
+        assert "max entries: 2" in sandbox_shell.execute("trashpolicy --max-entries 2 --max-age 0.5")
+        assert read_trash_policy() == TrashPolicy(max_entries=2, max_age=12 * 60 * 60)
+
+        # the worker applies the saved limits after every operation
+        for i in range(3):
+            create_file(os.path.join(TEST_SANDBOX_DIR, f'file{i}'), f"file{i}\n")
+            sandbox_shell.execute(f"rm file{i}")
+        TRASH_WORKER.wait()
+        with UndoJournal() as journal:
+            assert journal.count() == 2
+
+        with pytest.raises(ValueError):
+            sandbox_shell.execute("trashpolicy --max-bytes -1")
+
+        sandbox_shell.execute("trashpolicy --reset")
+        assert read_trash_policy() == TrashPolicy()
+    finally:
+        if os.path.exists(TRASH_POLICY_PATH):
+            os.remove(TRASH_POLICY_PATH)
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_trash_measured_without_lock(sandbox_shell, monkeypatch):
+    measuring = threading.Event()
+    measured = threading.Event()
+
+    def slow_get_size(path: str) -> int:
+        measuring.set()
+        measured.wait(timeout=5)
+        return get_size(path)
+
+    monkeypatch.setattr('src.trash.get_size', slow_get_size)
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'file'), "file\n")
+    sandbox_shell.execute("rm file")
+
+    # file commands are not blocked while the worker walks the trash
+    assert measuring.wait(timeout=5)
+    assert TRASH_LOCK.acquire(timeout=1)
+    TRASH_LOCK.release()
+
+    measured.set()
+    TRASH_WORKER.wait()
+    with UndoJournal() as journal:
+        assert journal.trash_size() == len("file\n")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+@pytest.mark.usefixtures("clear_undo_history")
+def test_mv_merge_by_rename(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'same'), "new\n")
+    new_subdir = create_dir(os.path.join(dir, 'new_subdir'))
+    for i in range(5):
+        create_file(os.path.join(new_subdir, f'file{i}'), f"file{i}\n")
+    create_file(os.path.join(create_dir(os.path.join(dir, 'common')), 'file'), "common\n")
+
+    other = create_dir(os.path.join(TEST_SANDBOX_DIR, 'other'))
+    dest = create_dir(os.path.join(other, 'dir'))
+    create_file(os.path.join(dest, 'same'), "old\n")
+    create_file(os.path.join(dest, 'kept'), "kept\n")
+    create_file(os.path.join(create_dir(os.path.join(dest, 'common')), 'other_file'), "other\n")
+    dest_tree = tree(dest)
+    new_subdir_inode = os.stat(new_subdir).st_ino
+
+    sandbox_shell.execute("mv dir other")
+    assert not os.path.exists(dir)
+
+    # a subtree missing in the destination is renamed as a whole and recorded as one path
+    assert os.stat(os.path.join(dest, 'new_subdir')).st_ino == new_subdir_inode
+    with UndoJournal() as journal:
+        moved = list(journal.paths(journal.last().id))
+    assert moved == [os.path.join(dest, 'new_subdir'), os.path.join(dest, 'same'), os.path.join(dest, 'common', 'file')]
+
+    with open(os.path.join(dest, 'same')) as f:
+        assert f.read() == "new\n"
+    assert os.path.exists(os.path.join(dest, 'kept'))
+    assert os.path.exists(os.path.join(dest, 'common', 'other_file'))
+
+    sandbox_shell.execute("undo")
+    assert dest_tree == tree(dest)
+    assert os.listdir(os.path.join(dir, 'new_subdir')) and os.path.exists(os.path.join(dir, 'common', 'file'))
+    with open(os.path.join(dest, 'same')) as f:
+        assert f.read() == "old\n"
+
+    # a directory over a file and a file over a directory are refused before anything is moved
+    create_file(os.path.join(dir, 'a'), "a\n")
+    create_dir(os.path.join(dir, 'kept'))
+    dest_tree = tree(dest)
+    with pytest.raises(FileExistsError, match="Destination is a file"):
+        sandbox_shell.execute("mv dir other")
+    assert dest_tree == tree(dest) and os.path.exists(os.path.join(dir, 'a'))
+
+    os.rmdir(os.path.join(dir, 'kept'))
+    create_dir(os.path.join(dest, 'a'))
+    dest_tree = tree(dest)
+    with pytest.raises(FileExistsError, match="Destination is a directory"):
+        sandbox_shell.execute("mv dir other")
+    assert dest_tree == tree(dest) and os.path.exists(os.path.join(dir, 'a'))
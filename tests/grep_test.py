@@ -1,11 +1,13 @@
 import pytest
 
 import os
+from argparse import ArgumentError
 
 from tests.setup import sandbox_shell
 from tests.setup import clear_or_create_test_sandbox
 from tests.setup import create_file, create_dir
 
+from src.commands.plugins.grep import SearchPlan, extract_literal_prefix, extract_required_literals
 from src.constants import TEST_SANDBOX_DIR
 
 
@@ -42,3 +44,216 @@ def test_grep(sandbox_shell):
     # -i flag
     result = sandbox_shell.execute("grep -i goose -r dir")
     assert result.count('"goose"') + result.count('"GOOSE"') == 5
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_grep_parallel(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    for i in range(10):
+        subdir = create_dir(os.path.join(dir, f'subdir{i}'))
+        for j in range(10):
+            create_file(os.path.join(subdir, f'file{j}'), f"goose {i} {j}\n")
+
+    #  jobs must be a natural number
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("grep goose -r dir -j 0")
+
+    #  parallel search gives the same results in the same order as sequential search
+    sequential = sandbox_shell.execute("grep goose -r dir -j 1")
+    parallel = sandbox_shell.execute("grep goose -r dir -j 4")
+    assert sequential.count('"goose"') == 100
+    assert sequential == parallel
+
+
+def test_search_plan():
+    #  literal prefix extraction
+    assert extract_literal_prefix("goose") == "goose"
+    assert extract_literal_prefix("goo+se") == "goo"
+    assert extract_literal_prefix("goos?e") == "goo"
+    assert extract_literal_prefix("goose|duck") == ""
+    assert extract_literal_prefix(".*goose") == ""
+
+    #  escaped ']' does not end a character class
+    assert extract_required_literals(r"[\]a]x") == ["x"]
+    assert extract_required_literals(r"x[a\]]y") == ["x", "y"]
+    assert extract_required_literals("[]a]x") == ["x"]
+
+    #  the body of an escape given by a char code is not a literal
+    assert extract_required_literals(r"\x41BC") == ["BC"]
+    assert extract_required_literals(r"\101BC") == ["BC"]
+    assert extract_required_literals(r"\0BC") == ["BC"]
+    assert extract_required_literals(r"\u0041BC") == ["BC"]
+    assert extract_required_literals(r"\N{LATIN CAPITAL LETTER A}BC") == ["BC"]
+    assert extract_required_literals(r"(A)\1BC") == ["BC"]
+
+    #  plain substring fast path
+    plan = SearchPlan("goose", ignore_case=False)
+    assert plan.literal == "goose"
+    assert list(plan.finditer("goose goosegoose")) == [(0, 5), (6, 11), (11, 16)]
+
+    #  regex path gives the same spans as re.finditer
+    plan = SearchPlan("go+se", ignore_case=False)
+    assert plan.literal is None
+    assert list(plan.finditer("gose goooose gse")) == [(0, 4), (5, 12)]
+
+    #  case insensitive search never uses the fast paths
+    plan = SearchPlan("goose", ignore_case=True)
+    assert plan.literal is None and plan.prefix == ""
+    assert list(plan.finditer("GOOSE")) == [(0, 5)]
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_grep_buffer(sandbox_shell):
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'empty'))
+    with open(os.path.join(TEST_SANDBOX_DIR, 'crlf'), 'wb') as f:
+        f.write(b"goose\r\nduck\r\ngoose duck")
+    with open(os.path.join(TEST_SANDBOX_DIR, 'binary'), 'wb') as f:
+        f.write(b"goose \xAA\xBB\xCC\n")
+
+    #  empty file
+    assert sandbox_shell.execute("grep goose empty") == ''
+
+    #  line numbers and line endings are kept
+    result = sandbox_shell.execute("grep goose crlf")
+    assert "crlf:1 -> \"goose\"\n" in result
+    assert "crlf:3 -> \"goose\" duck\n" in result
+
+    #  patterns that cannot be searched on the byte level
+    result = sandbox_shell.execute("grep 'duck$' crlf")
+    assert "crlf:2 -> \"duck\"\n" in result and "crlf:3" in result
+
+    #  binary files are skipped
+    assert sandbox_shell.execute("grep goose binary") == ''
+
+    #  a file is skipped as a whole, even when it is not utf-8 only after the first match
+    with open(os.path.join(TEST_SANDBOX_DIR, 'latin1'), 'wb') as f:
+        f.write(b"goose\n" * 10 + b"goose \xe9\n")
+    assert sandbox_shell.execute("grep goose latin1") == ''
+
+    #  required literals are not taken from character classes with escapes
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'brackets'), "ax\n]x\nxay\n")
+    assert sandbox_shell.execute(r"grep '[\]a]x' brackets").count("brackets:") == 2
+    assert "brackets:3" in sandbox_shell.execute(r"grep 'x[a\]]y' brackets")
+
+    #  nor from escapes given by a char code
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'codes'), "xxABCxx\n")
+    assert "codes:1" in sandbox_shell.execute(r"grep '\x41BC' codes")
+    assert "codes:1" in sandbox_shell.execute(r"grep '\101BC' codes")
+
+    #  word boundaries and char codes are not searched on the byte level of non-ascii text
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'unicode'), "é-\ncafé\n")
+    assert SearchPlan(r"\b-", ignore_case=False).bytes_regex is None
+    assert "unicode:1" in sandbox_shell.execute(r"grep '\b-' unicode")
+    assert "unicode:2" in sandbox_shell.execute(r"grep 'caf\xe9' unicode")
+    assert "unicode:2" in sandbox_shell.execute(r"grep 'caf\351' unicode")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_grep_filters(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file.txt'), "goose\n")
+    create_file(os.path.join(dir, 'file.py'), "goose\n")
+    create_file(os.path.join(dir, 'big.txt'), "goose\n" * 1000)
+    create_file(os.path.join(dir, 'archive.zip'), "goose\n")
+    with open(os.path.join(dir, 'binary'), 'wb') as f:
+        f.write(b"goose\n\0\0\0")
+
+    git = create_dir(os.path.join(dir, '.git'))
+    create_file(os.path.join(git, 'config'), "goose\n")
+
+    mount_trash = create_dir(os.path.join(dir, f'.Trash-{os.getuid()}', 'shell'))
+    create_file(os.path.join(mount_trash, 'trashed.txt'), "goose\n")
+    mount_purge = create_dir(os.path.join(dir, f'.Trash-{os.getuid()}.purge'))
+    create_file(os.path.join(mount_purge, 'purged.txt'), "goose\n")
+
+    build = create_dir(os.path.join(dir, 'build'))
+    create_file(os.path.join(build, 'output.txt'), "goose\n")
+
+    #  binary files, archives and VCS directories are skipped by default
+    result = sandbox_shell.execute("grep goose -r dir --max-filesize 1K")
+    assert "file.txt" in result and "file.py" in result and "output.txt" in result
+    assert "big.txt" not in result
+    assert "binary" not in result and "archive.zip" not in result and "config" not in result
+    assert "trashed.txt" not in result and "purged.txt" not in result
+
+    #  -a searches everything
+    result = sandbox_shell.execute("grep goose -r dir -a")
+    assert "binary" in result and "archive.zip" in result and "config" in result
+
+    #  --include, --exclude and --exclude-dir globs
+    result = sandbox_shell.execute("grep goose -r dir --include '*.txt' --exclude 'big*' --exclude-dir build")
+    assert "file.txt" in result
+    assert "file.py" not in result and "big.txt" not in result and "output.txt" not in result
+
+    #  invalid size
+    with pytest.raises(ArgumentError):
+        sandbox_shell.execute("grep goose -r dir --max-filesize 10Q")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_grep_index(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file1'), "python goose\n")
+    file2 = create_file(os.path.join(dir, 'file2'), "c++ duck\n")
+
+    sandbox_shell.execute("index --drop dir")
+
+    #  index is created
+    result = sandbox_shell.execute("index dir")
+    assert "2 files: 2 updated, 0 removed" in result
+
+    #  unchanged files are not reindexed
+    result = sandbox_shell.execute("index dir")
+    assert "2 files: 0 updated, 0 removed" in result
+
+    #  indexed search gives the same results
+    assert sandbox_shell.execute("grep goose -r dir --index") == sandbox_shell.execute("grep goose -r dir")
+    assert sandbox_shell.execute("grep 'go+se' -r dir --index").count('"goose"') == 1
+
+    #  changed and removed files are picked up
+    create_file(file2, "c++ goose\n")
+    os.remove(os.path.join(dir, 'file1'))
+    result = sandbox_shell.execute("grep goose -r dir --index")
+    assert "file2" in result and "file1" not in result
+
+    result = sandbox_shell.execute("index dir")
+    assert "1 files: 0 updated, 0 removed" in result
+
+    #  a filtered search does not remove the filtered out files from the index
+    create_file(os.path.join(dir, 'file3.py'), "python goose\n")
+    result = sandbox_shell.execute("grep goose -r dir --index --include '*.py'")
+    assert "file3.py" in result and "file2" not in result
+    result = sandbox_shell.execute("index dir")
+    assert "2 files: 0 updated, 0 removed" in result
+
+    sandbox_shell.execute("index --drop dir")
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_grep_gitignore(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, '.gitignore'), "node_modules/\n*.log\n/build\n!keep.log\n")
+    create_file(os.path.join(dir, 'file'), "goose\n")
+    create_file(os.path.join(dir, 'debug.log'), "goose\n")
+    create_file(os.path.join(dir, 'keep.log'), "goose\n")
+
+    node_modules = create_dir(os.path.join(dir, 'node_modules'))
+    create_file(os.path.join(node_modules, 'file'), "goose\n")
+
+    build = create_dir(os.path.join(dir, 'build'))
+    create_file(os.path.join(build, 'file'), "goose\n")
+
+    subdir = create_dir(os.path.join(dir, 'subdir'))
+    create_file(os.path.join(subdir, '.ignore'), "secret\n")
+    create_file(os.path.join(subdir, 'secret'), "goose\n")
+    create_file(os.path.join(subdir, 'debug.log'), "goose\n")
+    subdir_build = create_dir(os.path.join(subdir, 'build'))  # '/build' is anchored to dir
+    create_file(os.path.join(subdir_build, 'file'), "goose\n")
+
+    #  everything is searched by default
+    assert sandbox_shell.execute("grep goose -r dir").count('"goose"') == 8
+
+    #  ignored files and directories are skipped
+    result = sandbox_shell.execute("grep goose -r dir --gitignore")
+    assert result.count('"goose"') == 3
+    assert "dir/file:" in result and "keep.log" in result and "subdir/build/file" in result
@@ -1,12 +1,15 @@
 import pytest
 
 import os
+import sys
+import inspect
 
 from tests.setup import sandbox_shell
 from tests.setup import clear_or_create_test_sandbox
 from tests.setup import create_file, create_dir
 
 from src.path import tree
+from src.commands.core.navigation import user_name, group_name
 from src.constants import TEST_SANDBOX_DIR
 
 
@@ -47,6 +50,15 @@ def test_ls(sandbox_shell):
     sandbox_shell.execute("ls -l")
 
 
+def test_ls_owner_names():
+    assert user_name(os.getuid()) == user_name(os.getuid())
+    assert user_name.cache_info().hits >= 1
+
+    # unknown ids are shown as numbers
+    assert user_name(2 ** 31 - 2) == str(2 ** 31 - 2)
+    assert group_name(2 ** 31 - 2) == str(2 ** 31 - 2)
+
+
 @pytest.mark.usefixtures("clear_or_create_test_sandbox")
 def test_cd(sandbox_shell):
     create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
@@ -101,6 +113,27 @@ def test_cat(sandbox_shell):
     assert result == "line1\nline2\n"
 
 
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_cat_ranges(sandbox_shell):
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "".join(f"line{i}\n" for i in range(1, 6)))
+
+    binary_file = os.path.join(TEST_SANDBOX_DIR, 'binary_file')
+    with open(binary_file, 'wb') as f:
+        f.write(b'a\x00\x7f\xAA\n')
+
+    assert sandbox_shell.execute("cat file1 --head 2") == "line1\nline2\n"
+    assert sandbox_shell.execute("cat file1 --tail 2") == "line4\nline5\n"
+    assert sandbox_shell.execute("cat file1 --tail 10") == sandbox_shell.execute("cat file1")
+    assert sandbox_shell.execute("cat file1 --bytes 6-11") == "line2\n"
+    assert sandbox_shell.execute("cat file1 --bytes -4") == "line\n"
+
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("cat file1 --bytes 5-1")
+
+    # non-printing characters
+    assert sandbox_shell.execute("cat binary_file -v") == "a^@^?M-*\n"
+
+
 @pytest.mark.usefixtures("clear_or_create_test_sandbox")
 def test_tree(sandbox_shell):
     create_file(os.path.join(TEST_SANDBOX_DIR, 'file1'), "file1\n")
@@ -119,3 +152,95 @@ def test_tree(sandbox_shell):
     # tree directory
     result = sandbox_shell.execute("tree dir")
     assert "file1" in result and "file2" in result and "subdir" in result
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_tree_gitignore(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, '.gitignore'), "ignored_*\n")
+    create_file(os.path.join(dir, 'file1'), "file1_dir\n")
+    create_file(os.path.join(dir, 'ignored_file'), "ignored\n")
+    create_dir(os.path.join(dir, '.git'))
+
+    ignored_dir = create_dir(os.path.join(dir, 'ignored_dir'))
+    create_file(os.path.join(ignored_dir, 'file1'), "file1_ignored_dir\n")
+
+    result = sandbox_shell.execute("tree dir")
+    assert "ignored_file" in result and "ignored_dir" in result and ".git" in result
+
+    result = sandbox_shell.execute("tree dir --gitignore")
+    assert "file1" in result
+    assert "ignored_file" not in result and "ignored_dir" not in result and ".git\n" not in result
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_tree_deep(sandbox_shell):
+    depth = 100
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    subdir = dir
+    for _ in range(depth):
+        subdir = create_dir(os.path.join(subdir, 'd'))
+
+    # leave less stack than the depth of the directory, so a recursive walk would fail
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + depth // 2)
+    try:
+        lines = tree(dir).splitlines()
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    assert len(lines) == depth + 1
+    assert lines[-1] == '    ' * (depth - 1) + '└── d'
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_tree_options(sandbox_shell):
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    subdir = create_dir(os.path.join(dir, 'subdir'))
+    create_file(os.path.join(subdir, 'file1'), "file1_subdir\n")
+    create_file(os.path.join(subdir, 'file2'), "file2_subdir\n")
+    os.symlink(dir, os.path.join(subdir, 'loop'))
+
+    # depth limit
+    result = sandbox_shell.execute("tree dir -L 1")
+    assert "subdir" in result and "file1" not in result
+
+    with pytest.raises(ValueError):
+        sandbox_shell.execute("tree dir -L 0")
+
+    # collapsed directories
+    result = sandbox_shell.execute("tree dir --filelimit 2")
+    assert "subdir  [3 entries exceeds filelimit, not opening dir]" in result and "file1" not in result
+
+    # symbolic links are not followed by default
+    result = sandbox_shell.execute("tree dir")
+    assert "file1" in result and "loop\n" in result
+
+    result = sandbox_shell.execute("tree dir -l")
+    assert "loop  [recursive, not followed]" in result
+
+
+@pytest.mark.usefixtures("clear_or_create_test_sandbox")
+def test_ls_sort_and_recursion(sandbox_shell):
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'a_small'), "1\n")
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'b_large'), "1" * 100)
+    create_file(os.path.join(TEST_SANDBOX_DIR, 'c_medium'), "1" * 10)
+    os.utime(os.path.join(TEST_SANDBOX_DIR, 'a_small'), (0, 2000000000))
+
+    dir = create_dir(os.path.join(TEST_SANDBOX_DIR, 'dir'))
+    create_file(os.path.join(dir, 'file1'), "file1_dir\n")
+    subdir = create_dir(os.path.join(dir, 'subdir'))
+    create_file(os.path.join(subdir, 'file2'), "file2_subdir\n")
+
+    assert sandbox_shell.execute("ls") == "a_small b_large c_medium dir\n"
+    assert sandbox_shell.execute("ls -r") == "dir c_medium b_large a_small\n"
+    names = sandbox_shell.execute("ls -S").split()
+    assert names.index("b_large") < names.index("c_medium") < names.index("a_small")
+    assert sandbox_shell.execute("ls -t").startswith("a_small")
+
+    result = sandbox_shell.execute("ls -R dir")
+    assert result.splitlines() == ["dir:", "file1 subdir", "", "dir/subdir:", "file2"]
+
+    # unsorted listing is printed in pages
+    result = sandbox_shell.execute("ls -U -l")
+    assert len(result.splitlines()) == 4
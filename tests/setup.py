@@ -5,6 +5,7 @@ import shutil
 
 from src.constants import TEST_SANDBOX_DIR, UNDO_HISTORY_PATH, COMMAND_HISTORY_PATH
 from src.shell import Shell
+from src.trash import TRASH_WORKER
 
 
 @pytest.fixture()
@@ -22,6 +23,7 @@ def clear_or_create_test_sandbox() -> None:
 
 @pytest.fixture()
 def clear_undo_history() -> None:
+    TRASH_WORKER.wait()  # the worker of the previous test can still use the journal
     if os.path.exists(UNDO_HISTORY_PATH):
         os.remove(UNDO_HISTORY_PATH)
 
@@ -2,6 +2,8 @@ import pytest
 
 from tests.setup import sandbox_shell
 
+from src.command import OutputCapture, CAPTURE_OFF, CAPTURE_RING, CAPTURE_FULL
+
 
 def test_shell(sandbox_shell):
     #  command not found
@@ -10,3 +12,33 @@ def test_shell(sandbox_shell):
 
     #  empty command
     sandbox_shell.execute("")
+
+
+def test_print_lines(sandbox_shell):
+    env = sandbox_shell.env
+
+    #  lines are printed in buffered batches and captured in order
+    count = env.print_lines(f"line{i}" for i in range(100))
+    assert count == 100
+    assert env.command_output == "".join(f"line{i}\n" for i in range(100))
+
+
+def test_output_capture():
+    capture = OutputCapture(CAPTURE_OFF)
+    capture.append("line\n")
+    assert capture.getvalue() == ""
+
+    #  only the last characters are kept
+    capture = OutputCapture(CAPTURE_RING, size=10)
+    for i in range(100):
+        capture.append(f"line{i}\n")
+    assert capture.getvalue() == "98\nline99\n"
+    assert len(capture.chunks) == 1
+
+    capture = OutputCapture(CAPTURE_FULL)
+    for i in range(100):
+        capture.append(f"line{i}\n")
+    assert capture.getvalue() == "".join(f"line{i}\n" for i in range(100))
+
+    with pytest.raises(ValueError):
+        OutputCapture("partial")